@@ -31,11 +31,7 @@ class Sokoban:
             "#   t    #",
             "##########"
         ]
-        self.player_pos = [4, 5]
-        self.boxes = []
-        self.targets = []
-        self.walls = []
-        self.parse_level()
+        self.reset_level()
 
         # Pygame setup
         self.screen_width = len(self.level[0]) * TILE_SIZE
@@ -45,16 +41,31 @@ class Sokoban:
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont(None, 36)
 
-        # Load images (or use colored rectangles if images not found)
+        self.load_images()
+
+    def load_images(self):
+        # Load images once (or use colored rectangles if images not found).
+        # convert_alpha() matches the display format so blits don't convert every frame.
         try:
-            self.player_img = pygame.transform.scale(pygame.image.load("player.png"), (TILE_SIZE, TILE_SIZE))
-            self.box_img = pygame.transform.scale(pygame.image.load("box.png"), (TILE_SIZE, TILE_SIZE))
-            self.wall_img = pygame.transform.scale(pygame.image.load("wall.png"), (TILE_SIZE, TILE_SIZE))
-            self.target_img = pygame.transform.scale(pygame.image.load("target.png"), (TILE_SIZE, TILE_SIZE))
+            self.player_img = self.load_tile_image("player.png")
+            self.box_img = self.load_tile_image("box.png")
+            self.wall_img = self.load_tile_image("wall.png")
+            self.target_img = self.load_tile_image("target.png")
             self.use_images = True
-        except:
+        except (pygame.error, FileNotFoundError):
             self.use_images = False
 
+    def load_tile_image(self, filename):
+        return pygame.transform.scale(pygame.image.load(filename).convert_alpha(), (TILE_SIZE, TILE_SIZE))
+
+    def reset_level(self):
+        # Only the level state is rebuilt; the window and loaded images are kept
+        self.player_pos = [4, 5]
+        self.boxes = []
+        self.targets = []
+        self.walls = []
+        self.parse_level()
+
     def parse_level(self):
         for y, row in enumerate(self.level):
             for x, char in enumerate(row):
@@ -168,7 +179,7 @@ class Sokoban:
                     elif event.key == pygame.K_RIGHT:
                         self.move_player(1, 0)
                     elif event.key == pygame.K_r:  # Reset level
-                        self.__init__()
+                        self.reset_level()
                     elif event.key == pygame.K_ESCAPE:  # Quit game
                         running = False
 
@@ -1,8 +1,30 @@
 import pygame
 import sys
+import argparse
 import json
 import os
-from datetime import datetime
+import base64
+import gc
+import hashlib
+import hmac
+import mmap
+import multiprocessing
+import queue
+import random
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import deque
+from array import array
+from bisect import bisect_left, insort
+from heapq import heappop, heappush, merge as heap_merge
+from collections import OrderedDict
+from datetime import datetime, timedelta
 
 # Initialize pygame
 pygame.init()
@@ -22,6 +44,9 @@ TEXT_INPUT_COLOR = (255, 255, 255)
 TEXT_INPUT_ACTIVE_COLOR = (220, 220, 255)
 EDITOR_GRID_COLOR = (200, 200, 200)
 MESSAGE_COLOR = (200, 0, 0)  # For error messages
+EDITOR_REACHABLE_COLOR = (70, 200, 70, 50)  # Overlay: where the player can walk
+EDITOR_DEAD_COLOR = (60, 60, 60, 90)  # Overlay: squares a box can never leave towards a target
+HEATMAP_COLOR = (220, 30, 30)  # Telemetry heatmap, alpha scaled by how often a tile was used
 
 # User roles
 ANONYMOUS = 0
@@ -34,26 +59,2058 @@ EDITOR_GRID_COLS = 20
 EDITOR_OFFSET_X = 50
 EDITOR_OFFSET_Y = 150
 
+# Movement
+DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]  # (d_row, d_col): up, down, left, right
+AUTO_MOVE_STEP_MS = 40  # Delay between steps when playing out a click-to-move or box-drag path
+
+# Hint search
+HINT_TIME_BUDGET = 2.0  # Seconds of background search per hint request
+HINT_MAX_STATES = 300000  # Search tree size cap, keeps memory bounded on huge levels
+HINT_DISPLAY_FRAMES = 240
+HINT_ENGINE_CACHE_SIZE = 4  # Levels whose hint engine (and its search tables) is kept, least recently used dropped
+
+# Level import / binary level packs
+USERS_FILE = "users.json"
+LEVELS_FILE = "levels.json"
+SCORES_FILE = "scores.json"
+DATA_POLL_INTERVAL_MS = 1000  # How often files shared with other instances are checked for changes
+DATA_LOCK_REFRESH_SECONDS = 1.0  # Held lock files are touched this often, so a long write never looks abandoned
+SCORE_MERGE_BUDGET_MS = 4  # Frame time spent merging scores read by the background sync thread
+SCORE_SORT_RUN_ENTRIES = 100000  # export-scores and import-scores sort scores.json this many entries at a time
+JSON_READ_CHUNK = 64 * 1024  # Characters read at a time by iter_json_object
+TELEMETRY_FILE = "telemetry.json"
+TELEMETRY_FLUSH_MS = 30000  # Buffered telemetry is merged into TELEMETRY_FILE this often
+HEATMAP_MAX_ALPHA = 180
+DATA_LOCK_STALE_SECONDS = 5.0  # A lock file not touched for this long was left behind by a crashed instance
+PASSWORD_HASH_ITERATIONS = 200000  # PBKDF2-SHA256 rounds; older hashes are upgraded on the next login
+PASSWORD_SALT_BYTES = 16
+LEGACY_USERS_FILE = "sokoban_users.json"  # Older version's users, unsalted SHA-256; copied into USERS_FILE at startup
+LEGACY_HASH_PREFIX = "sha256+"  # PBKDF2 of an unsalted SHA-256 hash, until the user logs in and we know the password
+SESSION_FILE = "sessions.json"  # Signed "Continue as" token of the last player on each machine
+SESSION_KEY_FILE = "session.key"
+SESSION_LIFETIME_DAYS = 14
+LEVEL_PACK_FILE = "levels.pack"
+LEVEL_PACK_ID_PREFIX = "pack-"  # Level IDs "pack-0", "pack-1", ... refer to levels in the pack
+LEVEL_PACK_MAGIC = b"SOKPACK1"
+LEVEL_PACK_HEADER = struct.Struct("<8sIQ")  # magic, level count, offset of the offset index
+LEVEL_PACK_CACHE_SIZE = 32  # Decoded pack levels kept, enough for a selection page plus the level in play
+# Standard XSB symbols -> this game's level chars. '*' (box on target) and '+' (player on target) have no
+# p/b/t equivalent, so parse_level understands them as-is.
+XSB_TO_LEVEL_CHARS = str.maketrans({"@": "p", "$": "b", ".": "t", "-": " ", "_": " "})
+XSB_ROW_CHARS = set("#@+$*.-_ ")
+
+# Level fingerprints: walkable chars and what they become once marked as part of the player's area
+FINGERPRINT_AREA_MARKS = {ord(' '): ord('-'), ord('p'): ord('-'), ord('t'): ord('.'), ord('+'): ord('.')}
+
+# Ghost replays
+GHOST_STEP_MS = 180  # Pace of the ghost replay
+GHOST_ALPHA = 110
+
+# Leaderboard view
+LEADERBOARD_ROW_HEIGHT = 25
+LEADERBOARD_PAGE_SIZE = 50  # Rows fetched per query_scores call
+LEADERBOARD_ROW_CACHE_SIZE = 200  # Rendered row surfaces kept around
+LEADERBOARD_COL_WIDTHS = [80, 200, 100, 200]  # Rank, Username, Moves, Date
+
+# Memory diagnostics (play --diagnostics)
+DIAG_TRACE_FRAMES = 5  # Stack depth kept by tracemalloc for each allocation
+DIAG_REPORT_MS = 60000  # A memory report is printed this often (and on F3), from a background thread
+DIAG_REPORT_ATTEMPTS = 3  # Sizing restarts if the frame loop changes a container mid-walk; gives up after this many
+DIAG_GROWTH_BYTES = 256 * 1024  # Growth since the last visit to a state that counts as a possible leak
+DIAG_TOP_STATS = 5  # Allocation sites listed when growth is flagged
+
+# Rules fuzzer (python Task2.py fuzz)
+FUZZ_MOVES_PER_CASE = 200
+FUZZ_REACHABLE_CHECK_EVERY = 8  # Steps between comparisons of the cached reachable area with a fresh flood fill
+FUZZ_MOVE_LETTERS = "UDLR"  # Same order as DIRECTIONS
+
+# Load test (python Task2.py load-test)
+LOAD_TEST_MIX = "register=2,login=8,score=50,save_level=5,leaderboard=35"  # Relative weights of the operations
+LOAD_TEST_OPERATIONS = ["register", "login", "score", "save_level", "leaderboard"]
+LOAD_TEST_PASSWORD = "loadtest"  # Password of every seeded and registered load-test user
+LOAD_TEST_PERCENTILES = [("p50", 0.5), ("p99", 0.99), ("p999", 0.999)]
+
+# Autosave of games in progress
+AUTOSAVE_DIR = "autosave"  # One append-only log per user
+AUTOSAVE_INTERVAL_MS = 2000
+
+# Level selection thumbnails
+THUMBNAIL_WIDTH = 60
+THUMBNAIL_HEIGHT = 40
+THUMBNAIL_DIR = "thumbnails"  # PNG cache, one file per distinct level layout
+THUMBNAIL_CACHE_SIZE = 64  # Thumbnails kept in memory
+THUMBNAIL_COLORS = {'#': WALL_COLOR, 't': TARGET_COLOR, 'b': BOX_COLOR, '*': TARGET_BOX_COLOR, 'p': PLAYER_COLOR,
+                    '+': PLAYER_COLOR}
+
+# Tile atlas constants
+ATLAS_BASE_SIZE = 64  # Tiles are painted once at this size, then scaled per zoom level
+ATLAS_TILES = ["floor", "wall", "target", "box", "box_on_target", "player", "player_on_target"]
+TILE_IMAGE_FILES = {"player": "player.png", "box": "box.png", "wall": "wall.png", "target": "target.png"}
+
+# Global leaderboard constants
+GLOBAL_POINTS_PER_LEVEL = 1000  # Matching a level's best score is worth this many points
+GLOBAL_LEADERBOARD_ROWS = 5  # Rows shown on the login/menu screens
+RANK_BUCKET_SIZE = 512  # Keys per bucket in RankedKeys; a bucket is split when it grows to twice this
+RANK_REBUILD_FRACTION = 8  # A batch changing more than 1/8 of the keys re-sorts them all instead
+
+
+# All tiles live side by side in one surface so a whole board can be drawn with a single Surface.blits call
+class TileAtlas:
+    def __init__(self, base_size=ATLAS_BASE_SIZE):
+        self.base_size = base_size
+        self.scaled = {}  # tile_size -> (atlas surface, {tile name: area rect})
+        self.ghost_scaled = {}  # tile_size -> translucent copy of the scaled atlas
+        self.base_atlas = self.build_atlas()
+
+    def load_tile_image(self, tile_name):
+        # Optional artwork; any failure falls back to the coloured rectangles
+        filename = TILE_IMAGE_FILES.get(tile_name)
+        if not filename or not os.path.exists(filename):
+            return None
+        try:
+            image = pygame.image.load(filename)
+            if pygame.display.get_surface() is not None:
+                image = image.convert_alpha()
+            return pygame.transform.smoothscale(image, (self.base_size, self.base_size))
+        except (pygame.error, ValueError):
+            return None
+
+    def paint_tile(self, tile, name, images):
+        # Composite tiles (box on target, player on target) are painted here once instead of every frame
+        tile.fill(FLOOR_COLOR)
+        if name == "floor":
+            return
+        if name == "wall":
+            if images["wall"]:
+                tile.blit(images["wall"], (0, 0))
+            else:
+                tile.fill(WALL_COLOR)
+            return
+
+        on_target = name in ("target", "box_on_target", "player_on_target")
+        if on_target:
+            if images["target"]:
+                tile.blit(images["target"], (0, 0))
+            else:
+                tile.fill(TARGET_COLOR)
+
+        if name in ("box", "box_on_target"):
+            if images["box"]:
+                tile.blit(images["box"], (0, 0))
+                if on_target:
+                    pygame.draw.rect(tile, TARGET_BOX_COLOR, tile.get_rect(), 3)
+            else:
+                tile.fill(TARGET_BOX_COLOR if on_target else BOX_COLOR)
+        elif name in ("player", "player_on_target"):
+            if images["player"]:
+                tile.blit(images["player"], (0, 0))
+            else:
+                tile.fill(PLAYER_COLOR)
+
+    def build_atlas(self):
+        images = {name: self.load_tile_image(name) for name in TILE_IMAGE_FILES}
+        atlas = pygame.Surface((self.base_size * len(ATLAS_TILES), self.base_size))
+        for i, name in enumerate(ATLAS_TILES):
+            tile_rect = pygame.Rect(i * self.base_size, 0, self.base_size, self.base_size)
+            self.paint_tile(atlas.subsurface(tile_rect), name, images)
+        return self.convert_surface(atlas)
+
+    def convert_surface(self, surface):
+        # Match the display pixel format once so blits don't convert on every frame
+        if pygame.display.get_surface() is not None:
+            return surface.convert()
+        return surface
+
+    def get_scaled(self, tile_size):
+        if tile_size not in self.scaled:
+            atlas = pygame.Surface((tile_size * len(ATLAS_TILES), tile_size))
+            areas = {}
+            for i, name in enumerate(ATLAS_TILES):
+                base_rect = pygame.Rect(i * self.base_size, 0, self.base_size, self.base_size)
+                # Scale tile by tile so neighbouring tiles never bleed into each other
+                scaled_tile = pygame.transform.smoothscale(self.base_atlas.subsurface(base_rect),
+                                                           (tile_size, tile_size))
+                areas[name] = pygame.Rect(i * tile_size, 0, tile_size, tile_size)
+                atlas.blit(scaled_tile, areas[name])
+            self.scaled[tile_size] = (self.convert_surface(atlas), areas)
+        return self.scaled[tile_size]
+
+    def get_ghost(self, tile_size):
+        if tile_size not in self.ghost_scaled:
+            ghost = self.get_scaled(tile_size)[0].copy()
+            ghost.set_alpha(GHOST_ALPHA)
+            self.ghost_scaled[tile_size] = ghost
+        return self.ghost_scaled[tile_size]
+
+    def draw_board(self, surface, tile_size, cells, offset_x, offset_y, spacing=None, ghost=False):
+        # cells: iterable of (row, col, tile name); spacing is the cell pitch if it differs from the tile size
+        atlas, areas = self.get_scaled(tile_size)
+        if ghost:
+            atlas = self.get_ghost(tile_size)
+        spacing = spacing or tile_size
+        surface.blits([(atlas, (offset_x + c * spacing, offset_y + r * spacing), areas[name])
+                       for r, c, name in cells], doreturn=False)
+
+
+def thumbnail_key(level_rows):
+    # Content hash, so a thumbnail is reused for identical layouts and a changed level gets a new one
+    content = "\n".join(level_rows) + f"\n{THUMBNAIL_WIDTH}x{THUMBNAIL_HEIGHT}"
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()[:20]
+
+
+def render_thumbnail(level_rows):
+    # Flat colours on a private surface, so it can run off the main thread without touching the shared atlas
+    surface = pygame.Surface((THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
+    surface.fill(FLOOR_COLOR)
+    cols = max(map(len, level_rows), default=0)
+    tile = max(1, min(THUMBNAIL_WIDTH // max(cols, 1), THUMBNAIL_HEIGHT // max(len(level_rows), 1)))
+    offset_x = (THUMBNAIL_WIDTH - cols * tile) // 2
+    offset_y = (THUMBNAIL_HEIGHT - len(level_rows) * tile) // 2
+    for r, row in enumerate(level_rows):
+        for c, char in enumerate(row):
+            if char in THUMBNAIL_COLORS:
+                surface.fill(THUMBNAIL_COLORS[char], (offset_x + c * tile, offset_y + r * tile, tile, tile))
+    return surface
+
+
+# Level previews for the selection screen: an in-memory LRU in front of a PNG cache on disk, filled by a
+# background thread so paging never waits on rendering or disk
+class ThumbnailCache:
+    def __init__(self, directory=THUMBNAIL_DIR):
+        self.directory = directory
+        self.memory = OrderedDict()  # key -> surface, least recently used first
+        self.level_keys = {}  # level_id -> key it was last shown with, to spot edited levels
+        self.pending = set()  # Keys queued or being built
+        self.generation = 0  # Bumped when the visible page changes; older queued jobs are dropped
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.png")
+
+    def show_page(self, levels):
+        # levels: (level_id, rows) on the page now visible; only these are loaded or built
+        self.generation += 1
+        for level_id, level_rows in levels:
+            key = thumbnail_key(level_rows)
+            old_key = self.level_keys.get(level_id)
+            self.level_keys[level_id] = key
+            if old_key and old_key != key:
+                self.invalidate(old_key)
+            if key not in self.memory and key not in self.pending:
+                self.pending.add(key)
+                self.jobs.put((self.generation, key, level_rows))
+
+    def invalidate(self, key):
+        # The level was edited; drop its old preview unless another level still has that exact layout
+        if key in self.level_keys.values():
+            return
+        self.memory.pop(key, None)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def work(self):
+        while True:
+            generation, key, level_rows = self.jobs.get()
+            if generation != self.generation:
+                self.results.put((key, None))  # Paged away before it was built
+                continue
+            surface = None
+            if os.path.exists(self.path(key)):
+                try:
+                    surface = pygame.image.load(self.path(key))
+                except pygame.error:
+                    surface = None  # Corrupt file, render it again
+            if surface is None:
+                surface = render_thumbnail(level_rows)
+                try:
+                    os.makedirs(self.directory, exist_ok=True)
+                    tmp_path = os.path.join(self.directory, f"{key}.{os.getpid()}.tmp.png")
+                    pygame.image.save(surface, tmp_path)
+                    os.replace(tmp_path, self.path(key))
+                except (OSError, pygame.error) as e:
+                    print(f"Warning: could not cache thumbnail: {e}")
+            self.results.put((key, surface))
+
+    def poll(self):
+        # Called from the main thread: moves finished thumbnails into the LRU
+        while True:
+            try:
+                key, surface = self.results.get_nowait()
+            except queue.Empty:
+                return
+            self.pending.discard(key)
+            if surface is None:
+                continue
+            if pygame.display.get_surface():
+                surface = surface.convert()
+            self.memory[key] = surface
+            if len(self.memory) > THUMBNAIL_CACHE_SIZE:
+                self.memory.popitem(last=False)
+
+    def get(self, level_id):
+        key = self.level_keys.get(level_id)
+        surface = self.memory.get(key)
+        if surface is not None:
+            self.memory.move_to_end(key)
+        return surface
+
+
+def find_live_squares(open_cells, targets):
+    # Cells from which a box can still be pushed onto some target, found by pulling boxes back from every target
+    live = {t for t in targets if t in open_cells}
+    stack = list(live)
+    while stack:
+        r, c = stack.pop()
+        for dr, dc in DIRECTIONS:
+            box_from = (r - dr, c - dc)
+            player_from = (r - 2 * dr, c - 2 * dc)  # Where the player stood to push the box from box_from
+            if box_from not in live and box_from in open_cells and player_from in open_cells:
+                live.add(box_from)
+                stack.append(box_from)
+    return live
+
+
+# Push-level solver behind the hint key. It keeps its transposition table, known solution paths and
+# proven-dead states between requests, so hints for the same level get faster as the player moves.
+class HintEngine:
+    def __init__(self, level_rows, walls, targets):
+        open_cells = [(r, c) for r, row in enumerate(level_rows) for c in range(len(row)) if (r, c) not in walls]
+        self.cells = open_cells
+        self.index = {cell: i for i, cell in enumerate(open_cells)}
+        # neighbours[i][k] is the cell index one step in DIRECTIONS[k] from cell i, or -1
+        self.neighbours = [[self.index.get((r + dr, c + dc), -1) for dr, dc in DIRECTIONS] for r, c in open_cells]
+        self.targets = frozenset(self.index[t] for t in targets if t in self.index)
+        self.target_count = len(targets)
+        live = find_live_squares(set(open_cells), set(targets))
+        self.dead_squares = frozenset(i for i, cell in enumerate(open_cells) if cell not in live)
+        self.target_distance = [min((abs(r - tr) + abs(c - tc) for tr, tc in targets), default=0)
+                                for r, c in open_cells]
+
+        self.solution_next = {}  # state -> (box index, direction) for states on a known solution
+        self.dead_states = set()  # States proven unsolvable by an exhausted search
+        self.root = None  # Root of the resumable search tree below
+        self.tree = {}  # state -> (parent state, push) for the current root
+        self.open_heap = []
+        self.counter = 0
+
+    def region(self, player, boxes):
+        seen = {player}
+        stack = [player]
+        while stack:
+            for nxt in self.neighbours[stack.pop()]:
+                if nxt != -1 and nxt not in seen and nxt not in boxes:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return seen
+
+    def state_key(self, player, boxes):
+        # The player's exact cell doesn't matter, only which area they can walk around in
+        return min(self.region(player, boxes)), boxes
+
+    def heuristic(self, boxes):
+        distances = sorted(self.target_distance[b] for b in boxes)
+        return sum(distances[:self.target_count])
+
+    def remember_solution(self, state):
+        while self.tree.get(state) is not None:
+            parent, push = self.tree[state]
+            self.solution_next[parent] = push
+            state = parent
+
+    def hint_from(self, push):
+        box, direction = push
+        return "push", self.cells[box], DIRECTIONS[direction]
+
+    def search(self, player_cell, box_cells, deadline):
+        if len(box_cells) < self.target_count:
+            return ("unsolvable",)
+        boxes = frozenset(self.index[b] for b in box_cells if b in self.index)
+        prune_dead = len(boxes) == self.target_count  # Every box must end on a target
+        if prune_dead and any(b in self.dead_squares and b not in self.targets for b in boxes):
+            return ("unsolvable",)
+        if self.targets <= boxes:
+            return ("solved",)
+        root = self.state_key(self.index[player_cell], boxes)
+        if root in self.solution_next:
+            return self.hint_from(self.solution_next[root])
+        if root in self.dead_states:
+            return ("unsolvable",)
+
+        if self.root != root:
+            # New position: start a fresh tree, keeping solutions and dead states from earlier searches
+            self.root = root
+            self.tree = {root: None}
+            self.open_heap = [(self.heuristic(boxes), 0, root)]
+
+        while self.open_heap:
+            self.counter += 1
+            if self.counter % 64 == 0 and (time.monotonic() > deadline or len(self.tree) > HINT_MAX_STATES):
+                return ("timeout",)  # Tree and heap are kept, so asking again resumes here
+            _, pushes, state = heappop(self.open_heap)
+            norm_player, state_boxes = state
+            if self.targets <= state_boxes or (state != root and state in self.solution_next):
+                self.remember_solution(state)
+                return self.hint_from(self.solution_next[root])
+
+            reachable = self.region(norm_player, state_boxes)
+            for box in state_boxes:
+                for k, push_to in enumerate(self.neighbours[box]):
+                    push_from = self.neighbours[box][k ^ 1]  # DIRECTIONS pairs opposites as (0, 1) and (2, 3)
+                    if push_to == -1 or push_from not in reachable or push_to in state_boxes:
+                        continue
+                    if prune_dead and push_to in self.dead_squares:
+                        continue
+                    child_boxes = state_boxes - {box} | {push_to}
+                    child = self.state_key(box, child_boxes)
+                    if child in self.tree or child in self.dead_states:
+                        continue
+                    self.tree[child] = (state, (box, k))
+                    heappush(self.open_heap, (pushes + 1 + 2 * self.heuristic(child_boxes), pushes + 1, child))
+
+        # Nothing reachable from the root solves the level, so none of the explored states can either
+        self.dead_states.update(self.tree)
+        self.root = None
+        self.tree = {}
+        return ("unsolvable",)
+
+
+# Level editor analysis: components, dead squares, player area and frozen boxes for a grid of level chars.
+# cell_changed() only records the edit; refresh() then recomputes just the parts of the grid around it.
+class EditorAnalysis:
+    def __init__(self, grid):
+        self.grid = grid  # Rows of chars (lists in the editor, strings for saved levels), read live
+        self.boxes = {(r, c) for r, row in enumerate(grid) for c, char in enumerate(row) if char == 'b'}
+        self.targets = {(r, c) for r, row in enumerate(grid) for c, char in enumerate(row) if char == 't'}
+        self.player = next(((r, c) for r, row in enumerate(grid) for c, char in enumerate(row) if char == 'p'), None)
+        self.component_of = {}  # open cell -> component id (walls split the grid into components)
+        self.components = {}  # component id -> set of cells
+        self.live = {}  # component id -> live squares in it, see find_live_squares
+        self.next_component = 0
+        self.reachable = set()
+        self.dead_squares = set()
+        self.frozen_boxes = set()
+        self.version = 0
+        self.label_components([(r, c) for r, row in enumerate(grid) for c in range(len(row))])
+        self.dirty = set()
+        self.structure_dirty = False
+        self.refreshed_player = self.player  # Player cell reachable was last computed from
+        self.update_reachable()
+        self.update_frozen(set(self.boxes))
+
+    def is_open(self, r, c):
+        return 0 <= r < len(self.grid) and 0 <= c < len(self.grid[r]) and self.grid[r][c] != '#'
+
+    def cell_changed(self, r, c, old_char, new_char):
+        # Counts are kept up to date immediately; everything else waits for refresh()
+        for char, cells in (('b', self.boxes), ('t', self.targets)):
+            if old_char == char:
+                cells.discard((r, c))
+            if new_char == char:
+                cells.add((r, c))
+        if old_char == 'p' and self.player == (r, c):
+            self.player = None
+        if new_char == 'p':
+            self.player = (r, c)
+        self.dirty.add((r, c))
+        # Walls change the components, targets change which squares are live
+        self.structure_dirty = self.structure_dirty or '#' in (old_char, new_char) or 't' in (old_char, new_char)
+
+    def label_components(self, cells):
+        for cell in cells:
+            if cell in self.component_of or not self.is_open(*cell):
+                continue
+            component = set()
+            stack = [cell]
+            component.add(cell)
+            while stack:
+                r, c = stack.pop()
+                for dr, dc in DIRECTIONS:
+                    nxt = (r + dr, c + dc)
+                    if nxt not in component and self.is_open(*nxt):
+                        component.add(nxt)
+                        stack.append(nxt)
+            component_id = self.next_component
+            self.next_component += 1
+            for member in component:
+                self.component_of[member] = component_id
+            self.components[component_id] = component
+            self.live[component_id] = find_live_squares(component, self.targets & component)
+
+    def player_component(self):
+        if self.player is None or self.player not in self.component_of:
+            return set()
+        return self.components[self.component_of[self.player]]
+
+    def update_reachable(self):
+        self.refreshed_player = self.player
+        self.reachable = set()
+        self.dead_squares = set()
+        area = self.player_component()
+        if area:  # Empty without a player, which leaves nothing reachable and nothing to call dead
+            self.dead_squares = area - self.live[self.component_of[self.player]]
+            stack = [self.player]
+            self.reachable.add(self.player)
+            while stack:
+                r, c = stack.pop()
+                for dr, dc in DIRECTIONS:
+                    nxt = (r + dr, c + dc)
+                    if nxt in area and nxt not in self.reachable and nxt not in self.boxes:
+                        self.reachable.add(nxt)
+                        stack.append(nxt)
+
+    def is_blocked(self, cell, axis, checking):
+        # A box can't move along an axis if a wall, or a box that is itself stuck, sits on either side of it
+        r, c = cell
+        dr, dc = axis
+        for side in ((r + dr, c + dc), (r - dr, c - dc)):
+            if not self.is_open(*side) or side in checking:  # Boxes already being checked count as walls
+                return True
+            if side in self.boxes:
+                checking.add(side)
+                if self.is_blocked(side, (dc, dr), checking):
+                    return True
+        return False
+
+    def update_frozen(self, boxes):
+        for box in boxes:
+            self.frozen_boxes.discard(box)
+            if box in self.boxes and self.is_blocked(box, (1, 0), {box}) and self.is_blocked(box, (0, 1), {box}):
+                self.frozen_boxes.add(box)
+
+    def refresh(self):
+        if not self.dirty:
+            return
+        around = set(self.dirty)
+        for r, c in self.dirty:
+            around.update((r + dr, c + dc) for dr, dc in DIRECTIONS)
+
+        if self.structure_dirty:
+            # Relabel only the components touching the edited cells
+            stale = {self.component_of[cell] for cell in around if cell in self.component_of}
+            relabel = set(around)
+            for component_id in stale:
+                component = self.components.pop(component_id)
+                del self.live[component_id]
+                for cell in component:
+                    del self.component_of[cell]
+                relabel |= component
+            self.label_components(relabel)
+
+        player_area = self.player_component()
+        # The player may have been erased or painted over, leaving self.player None and outside the edit
+        if self.structure_dirty or self.player != self.refreshed_player or not player_area.isdisjoint(around):
+            self.update_reachable()
+
+        # Freezing depends only on walls and on boxes touching each other, so checking the box clusters
+        # next to the edit is enough
+        to_check = set()
+        stack = [cell for cell in around if cell in self.boxes or cell in self.frozen_boxes]
+        while stack:
+            box = stack.pop()
+            if box in to_check:
+                continue
+            to_check.add(box)
+            r, c = box
+            stack.extend(nxt for nxt in ((r + dr, c + dc) for dr, dc in DIRECTIONS) if nxt in self.boxes)
+        self.update_frozen(to_check)
+
+        self.dirty = set()
+        self.structure_dirty = False
+        self.version += 1
+
+    def unreachable_targets(self):
+        return self.targets - self.player_component() if self.player else set()
+
+    def problems(self):
+        self.refresh()
+        problems = []
+        if self.player is None:
+            problems.append("Level needs a player.")
+        if len(self.boxes) < len(self.targets):
+            problems.append(f"Level has {len(self.targets)} targets but only {len(self.boxes)} boxes.")
+        if self.player is not None:
+            unreachable_targets = self.unreachable_targets()
+            if unreachable_targets:
+                problems.append(f"{len(unreachable_targets)} target(s) can't be reached by the player.")
+            unreachable_boxes = self.boxes - self.player_component()
+            if unreachable_boxes:
+                problems.append(f"{len(unreachable_boxes)} box(es) can't be reached by the player.")
+        frozen = self.frozen_boxes - self.targets
+        if frozen:
+            problems.append(f"{len(frozen)} box(es) are stuck against walls.")
+        if len(self.boxes) == len(self.targets):
+            dead = (self.boxes & self.dead_squares) - self.targets - frozen
+            if dead:
+                problems.append(f"{len(dead)} box(es) can never reach a target.")
+        return problems
+
+    def status_lines(self):
+        lines = [f"Boxes: {len(self.boxes)}", f"Targets: {len(self.targets)}"]
+        if self.player is None:
+            lines.append("No player")
+        if len(self.boxes) < len(self.targets):
+            lines.append("Too few boxes")
+        if self.unreachable_targets():
+            lines.append(f"Lost targets: {len(self.unreachable_targets())}")
+        if self.frozen_boxes - self.targets:
+            lines.append(f"Frozen boxes: {len(self.frozen_boxes - self.targets)}")
+        if len(self.boxes) == len(self.targets) and (self.boxes & self.dead_squares) - self.targets:
+            lines.append(f"Dead boxes: {len((self.boxes & self.dead_squares) - self.targets)}")
+        return lines
+
+
+# Single background thread running hint searches, so the frame loop never waits on them
+class HintWorker:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.results = {}  # request id -> result tuple
+        self.latest_request = 0
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def submit(self, engine, player_cell, box_cells):
+        with self.lock:
+            self.latest_request += 1
+            request_id = self.latest_request
+            self.results.clear()  # Results of older requests are superseded and would never be polled
+        self.jobs.put((request_id, engine, player_cell, tuple(box_cells)))
+        return request_id
+
+    def poll(self, request_id):
+        with self.lock:
+            return self.results.pop(request_id, None)
+
+    def cancel(self, request_id):
+        with self.lock:
+            self.results.pop(request_id, None)
+            if request_id == self.latest_request:
+                self.latest_request += 1  # Skips the search if it's still queued, drops its result if it's running
+
+    def work(self):
+        while True:
+            request_id, engine, player_cell, box_cells = self.jobs.get()
+            if request_id != self.latest_request:
+                continue  # Superseded by a newer request before we got to it
+            result = engine.search(player_cell, box_cells, time.monotonic() + HINT_TIME_BUDGET)
+            with self.lock:
+                if request_id == self.latest_request:  # Nobody will poll for a superseded or cancelled one
+                    self.results[request_id] = result
+
+
+def iter_xsb_levels(path, collection_name=None):
+    # Streams levels out of an XSB/.sok collection one at a time, never holding the whole file in memory.
+    # A plain text or ';' comment line before a level names it, "Title:"/"Author:" after it override that.
+    collection_name = collection_name or os.path.splitext(os.path.basename(path))[0]
+    count = 0
+    rows = []
+    finished = None  # Last complete level, held back in case Title/Author lines follow it
+    pending = {}  # Metadata seen before the next level's rows
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if "#" in line and set(line) <= XSB_ROW_CHARS:
+                if finished:
+                    yield finished
+                    finished = None
+                rows.append(line.rstrip().translate(XSB_TO_LEVEL_CHARS))
+                continue
+            if rows:
+                count += 1
+                finished = {"name": pending.get("name", f"{collection_name} {count}"), "data": rows,
+                            "created_by": pending.get("created_by", "import"),
+                            "date": datetime.now().strftime("%Y-%m-%d")}
+                rows, pending = [], {}
+            text = line.strip().lstrip(";").strip()
+            key, _, value = text.partition(":")
+            if key.lower() in ("title", "author") and value.strip():
+                field = "name" if key.lower() == "title" else "created_by"
+                (finished if finished is not None else pending)[field] = value.strip()
+            elif text and ":" not in text:
+                pending["name"] = text
+    if rows:
+        count += 1
+        finished = {"name": pending.get("name", f"{collection_name} {count}"), "data": rows,
+                    "created_by": pending.get("created_by", "import"), "date": datetime.now().strftime("%Y-%m-%d")}
+    if finished:
+        yield finished
+
+
+# Read-only, memory-mapped level pack. Layout: header, then one record per level (name, creator, date and the
+# run-length encoded rows), then an index of record offsets so any level opens without parsing the others.
+class LevelPack:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.index_offset = LEVEL_PACK_HEADER.unpack_from(self.data, 0)
+        if magic != LEVEL_PACK_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a level pack")
+        self.decoded = OrderedDict()  # number -> level dict, LRU; screens ask for the same levels every frame
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def read_strings(self, offset, count):
+        strings = []
+        for _ in range(count):
+            (length,) = struct.unpack_from("<H", self.data, offset)
+            strings.append(self.data[offset + 2: offset + 2 + length].decode("utf-8"))
+            offset += 2 + length
+        return strings, offset
+
+    def record_offset(self, number):
+        if not 0 <= number < self.count:
+            raise IndexError(number)
+        return struct.unpack_from("<Q", self.data, self.index_offset + 8 * number)[0]
+
+    def level_name(self, number):
+        # Only the record header is read, the grid stays untouched
+        (name, created_by), _ = self.read_strings(self.record_offset(number), 2)
+        return name, created_by
+
+    def get_level(self, number):
+        if number in self.decoded:
+            self.decoded.move_to_end(number)
+            return self.decoded[number]
+        (name, created_by, date), offset = self.read_strings(self.record_offset(number), 3)
+        (encoded_length,) = struct.unpack_from("<I", self.data, offset)
+        encoded = self.data[offset + 4: offset + 4 + encoded_length]
+        # Runs are (count, char) byte pairs over the rows joined with newlines
+        text = "".join(chr(encoded[i + 1]) * encoded[i] for i in range(0, len(encoded), 2))
+        level = {"name": name, "data": text.split("\n"), "created_by": created_by, "date": date}
+        self.decoded[number] = level
+        if len(self.decoded) > LEVEL_PACK_CACHE_SIZE:
+            self.decoded.popitem(last=False)
+        return level
+
+    @staticmethod
+    def encode_rows(rows):
+        text = "\n".join(rows).encode("ascii")
+        encoded = bytearray()
+        i = 0
+        while i < len(text):
+            run = 1
+            while i + run < len(text) and text[i + run] == text[i] and run < 255:
+                run += 1
+            encoded += bytes((run, text[i]))
+            i += run
+        return bytes(encoded)
+
+    @staticmethod
+    def write(path, levels):
+        # levels can be any iterable (e.g. iter_xsb_levels); only the 8-byte offsets are kept in memory
+        offsets = array("Q")
+        with open(path, "wb") as f:
+            f.write(LEVEL_PACK_HEADER.pack(LEVEL_PACK_MAGIC, 0, 0))
+            for level in levels:
+                offsets.append(f.tell())
+                for text in (level["name"], level.get("created_by", "import"), level.get("date", "")):
+                    encoded_text = text.encode("utf-8")[:65535]
+                    f.write(struct.pack("<H", len(encoded_text)) + encoded_text)
+                encoded = LevelPack.encode_rows(level["data"])
+                f.write(struct.pack("<I", len(encoded)) + encoded)
+            index_offset = f.tell()
+            f.write(offsets.tobytes())
+            f.seek(0)
+            f.write(LEVEL_PACK_HEADER.pack(LEVEL_PACK_MAGIC, len(offsets), index_offset))
+        return len(offsets)
+
+
+def level_fingerprint(rows):
+    # Same hash for levels that only differ by padding, rotation/reflection or where the player starts
+    # inside their walkable area
+    width = max((len(row) for row in rows), default=0)
+    grid = [row.ljust(width) for row in rows]
+    filled_rows = [r for r, row in enumerate(grid) if row.strip()]
+    filled_cols = [c for c in range(width) if any(row[c] != ' ' for row in grid)]
+    if not filled_rows:
+        return hashlib.sha1(b"").hexdigest()
+    grid = [row[filled_cols[0]: filled_cols[-1] + 1] for row in grid[filled_rows[0]: filled_rows[-1] + 1]]
+
+    # Replace the player by marking the whole area they can walk to: '-' floor and '.' target.
+    # Rows are joined with newlines, which act as walls between the end of one row and the next;
+    # a newline row above and below means neighbour indices never leave the buffer.
+    row_step = len(grid[0]) + 1
+    flat = bytearray("\n" * row_step + "\n".join(grid) + "\n" * (row_step + 1), "utf-8")
+    player = max(flat.find(b'p'), flat.find(b'+'))
+    if player != -1:
+        flat[player] = FINGERPRINT_AREA_MARKS[flat[player]]
+        stack = [player]
+        while stack:
+            i = stack.pop()
+            for j in (i - 1, i + 1, i - row_step, i + row_step):
+                mark = FINGERPRINT_AREA_MARKS.get(flat[j])
+                if mark:
+                    flat[j] = mark
+                    stack.append(j)
+    grid = flat[row_step: -row_step - 1].decode("utf-8").split("\n")
+
+    variants = []
+    for _ in range(4):
+        grid = ["".join(column) for column in zip(*grid[::-1])]  # Rotate 90 degrees
+        variants.append("\n".join(grid))
+        variants.append("\n".join(row[::-1] for row in grid))  # Mirror
+    return hashlib.sha1(min(variants).encode("utf-8")).hexdigest()
+
+
+def fingerprint_level_item(item):
+    level_id, rows = item
+    return level_fingerprint(rows), level_id
+
+
+def group_duplicate_levels(level_items, processes=None):
+    # level_items: iterable of (level_id, rows). Fingerprints are computed on every core.
+    groups = {}
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        for fingerprint, level_id in map(fingerprint_level_item, level_items):
+            groups.setdefault(fingerprint, []).append(level_id)
+    else:
+        with multiprocessing.Pool(processes) as pool:  # Shut down even if a worker or level_items raises
+            for fingerprint, level_id in pool.imap_unordered(fingerprint_level_item, level_items, chunksize=512):
+                groups.setdefault(fingerprint, []).append(level_id)
+    return [sorted(ids) for ids in groups.values() if len(ids) > 1]
+
+
+def encode_run(steps):
+    # steps: (direction index into DIRECTIONS, pushed) pairs. Each byte is one run of identical steps:
+    # bits 0-1 direction, bit 2 push flag, bits 3-7 run length - 1. Stored base64 so it fits in scores.json.
+    encoded = bytearray()
+    last_code, run = None, 0
+    for direction, pushed in steps:
+        code = direction | (4 if pushed else 0)
+        if code == last_code and run < 32:
+            run += 1
+            continue
+        if last_code is not None:
+            encoded.append(last_code | (run - 1) << 3)
+        last_code, run = code, 1
+    if last_code is not None:
+        encoded.append(last_code | (run - 1) << 3)
+    return base64.b64encode(bytes(encoded)).decode("ascii")
+
+
+def iter_run(encoded):
+    # Yields (direction index, pushed) one step at a time without expanding the whole run
+    for byte in base64.b64decode(encoded):
+        for _ in range((byte >> 3) + 1):
+            yield byte & 3, bool(byte & 4)
+
+
+def level_content_hash(level_rows):
+    return hashlib.sha1("\n".join(level_rows).encode("utf-8")).hexdigest()[:20]
+
+
+# Appends autosave records on a background thread, so fsync never stalls a frame
+class AutosaveWriter:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def write(self, path, records, truncate=False):
+        # truncate starts a new game's log; otherwise records are appended, one JSON object per line
+        self.jobs.put((path, "".join(json.dumps(record) + "\n" for record in records), truncate))
+
+    def work(self):
+        while True:
+            path, text, truncate = self.jobs.get()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'w' if truncate else 'a+') as f:
+                    if not truncate and f.tell() > 0:
+                        f.seek(f.tell() - 1)
+                        if f.read(1) != "\n":
+                            text = "\n" + text  # A crash left half a line; start ours on a fresh one
+                    f.write(text)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"Warning: autosave failed: {e}")
+            self.jobs.task_done()
+
+    def wait(self):
+        self.jobs.join()
+
+
+def read_autosave(path):
+    # Returns [level_id, content hash, steps] for the unfinished game in the log, or None
+    try:
+        with open(path, 'r') as f:
+            lines = f.read().splitlines()
+    except FileNotFoundError:
+        return None
+    game = None
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue  # Half-written line from a crash; its moves were never confirmed, so skip it
+        if "level" in record:
+            game = [record["level"], record["hash"], []]
+        elif game is None:
+            continue
+        elif "undo" in record:
+            del game[2][max(0, len(game[2]) - record["undo"]):]
+        elif "moves" in record:
+            game[2].extend(iter_run(record["moves"]))
+        elif record.get("done"):
+            game = None
+    return game
+
+
+def score_sort_key(entry):
+    # Fewest moves first; ties go to whoever got there first
+    return entry["moves"], entry.get("date", ""), entry["username"]
+
+
+def score_export_key(record):
+    # Order of score exports: by level, then leaderboard order within the level
+    return (record["level"],) + score_sort_key(record)
+
+
+def export_scores(scores, path):
+    # One JSON line per entry, sorted by score_export_key: a run that merge_score_runs can stream
+    records = sorted((dict(entry, level=level_id) for level_id, entries in scores.items() for entry in entries),
+                     key=score_export_key)
+    return write_score_run(records, path)
+
+
+def write_score_run(records, path):
+    # Written to a temporary file and renamed into place, so a failed write never leaves half a run; returns the count
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    count = 0
+    try:
+        with open(tmp_path, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+                count += 1
+        os.replace(tmp_path, path)
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass  # Renamed into place
+    return count
+
+
+def iter_score_run(path):
+    # Streams an export line by line, checking it is sorted so the merge can trust it
+    previous_key = None
+    with open(path, 'r') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            key = score_export_key(record)
+            if previous_key is not None and key < previous_key:
+                raise ValueError(f"{path}:{line_number}: entries out of order, export it again with export-scores")
+            previous_key = key
+            yield record
+
+
+def merge_score_runs(runs):
+    # k-way merge of sorted runs keeping each user's best entry per level, like add_score does. Holds one
+    # entry per run plus the usernames already seen on the current level.
+    level_id = None
+    seen_users = set()
+    for record in heap_merge(*runs, key=score_export_key):
+        if record["level"] != level_id:
+            level_id = record["level"]
+            seen_users = set()
+        if record["username"] in seen_users:
+            continue  # Sorted runs put the user's best entry on this level first
+        seen_users.add(record["username"])
+        yield record
+
+
+def split_score_runs(scores_path, directory):
+    # Streams scores.json into sorted runs of whole levels, about SCORE_SORT_RUN_ENTRIES entries each, so the
+    # local scores never have to be in memory all at once; returns the paths of the runs
+    run_paths = []
+    if not os.path.exists(scores_path):
+        return run_paths
+    batch, batch_entries = {}, 0
+    for level_id, entries in iter_json_object(scores_path):
+        batch[level_id] = entries
+        batch_entries += len(entries)
+        if batch_entries >= SCORE_SORT_RUN_ENTRIES:
+            run_paths.append(os.path.join(directory, f"local-{len(run_paths)}.jsonl"))
+            export_scores(batch, run_paths[-1])
+            batch, batch_entries = {}, 0
+    if batch:
+        run_paths.append(os.path.join(directory, f"local-{len(run_paths)}.jsonl"))
+        export_scores(batch, run_paths[-1])
+    return run_paths
+
+
+def export_scores_file(scores_path, path):
+    # export_scores for a whole scores file, streamed through sorted runs instead of loaded and sorted at once
+    with tempfile.TemporaryDirectory() as run_directory:
+        runs = [iter_score_run(run_path) for run_path in split_score_runs(scores_path, run_directory)]
+        return write_score_run(merge_score_runs(runs), path)
+
+
+def import_scores(paths, scores_path=SCORES_FILE):
+    # Merges exports into scores.json, written level by level as the merge produces them. The local scores go
+    # through sorted runs in a temporary directory and are merged alongside the exports.
+    lock_fd = acquire_file_lock(scores_path)
+    tmp_path = f"{scores_path}.{os.getpid()}.tmp"
+    try:
+        with tempfile.TemporaryDirectory() as run_directory:
+            runs = [iter_score_run(path) for path in split_score_runs(scores_path, run_directory) + list(paths)]
+            levels, entries = write_merged_scores(merge_score_runs(runs), tmp_path)
+        os.replace(tmp_path, scores_path)
+    finally:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass  # Renamed into place
+        release_file_lock(scores_path, lock_fd)
+    return levels, entries
+
+
+def write_merged_scores(records, path):
+    # Writes records sorted by score_export_key in the scores.json layout; returns (levels, entries)
+    levels = entries = 0
+    level_id = None
+    with open(path, 'w') as f:
+        f.write("{")
+        for record in records:
+            if record["level"] != level_id:
+                f.write("\n    ]," if level_id is not None else "")
+                level_id = record["level"]
+                f.write(f"\n    {json.dumps(level_id)}: [")
+                levels += 1
+            else:
+                f.write(",")
+            record.pop("level")
+            f.write(f"\n        {json.dumps(record)}")
+            entries += 1
+        f.write("\n    ]\n}\n" if level_id is not None else "}\n")
+    return levels, entries
+
+
+# Sorted view over one level's score list (the same list object stored in scores.json), with a key list for
+# bisecting and a per-user lookup, so queries never scan or re-sort the whole list
+class LevelScoreIndex:
+    def __init__(self, entries):
+        entries.sort(key=score_sort_key)
+        self.entries = entries
+        self.keys = [score_sort_key(entry) for entry in entries]
+        self.by_user = {entry["username"]: entry for entry in entries}
+        self.version = 0
+        self.by_date = sorted((entry.get("date", ""), entry["username"]) for entry in entries)  # Time-ordered index
+        self.window = None  # (since, sorted keys of the entries dated on or after since), kept up to date by put
+
+    def window_keys(self, since):
+        # Built from the tail of by_date, so it costs the size of the window rather than of the whole level
+        if self.window is None or self.window[0] != since:
+            recent = self.by_date[bisect_left(self.by_date, (since,)):]
+            self.window = (since, sorted(score_sort_key(self.by_user[username]) for _, username in recent))
+        return self.window[1]
+
+    def put(self, entry):
+        # Replaces the user's previous entry, if any
+        old_entry = self.by_user.get(entry["username"])
+        if old_entry is not None:
+            old_key = score_sort_key(old_entry)
+            i = bisect_left(self.keys, old_key)
+            del self.keys[i]
+            del self.entries[i]
+            del self.by_date[bisect_left(self.by_date, (old_key[1], old_key[2]))]
+            if self.window and old_key[1] >= self.window[0]:
+                del self.window[1][bisect_left(self.window[1], old_key)]
+        key = score_sort_key(entry)
+        i = bisect_left(self.keys, key)
+        self.keys.insert(i, key)
+        self.entries.insert(i, entry)
+        self.by_user[entry["username"]] = entry
+        insort(self.by_date, (key[1], key[2]))
+        if self.window and key[1] >= self.window[0]:
+            insort(self.window[1], key)
+        self.version += 1
+
+    def query(self, offset, limit, since=None):
+        # Returns (total matching, [(rank, entry), ...]) for one page
+        if since is None:
+            page = range(offset, min(offset + limit, len(self.entries)))
+            return len(self.entries), [(i + 1, self.entries[i]) for i in page]
+        keys = self.window_keys(since)
+        page = keys[offset:offset + limit]
+        return len(keys), [(offset + n + 1, self.by_user[key[2]]) for n, key in enumerate(page)]
+
+    def rank(self, username, since=None):
+        entry = self.by_user.get(username)
+        if entry is None:
+            return None
+        key = score_sort_key(entry)
+        if since is None:
+            return bisect_left(self.keys, key) + 1
+        if key[1] < since:
+            return None
+        return bisect_left(self.window_keys(since), key) + 1
+
+
+# Scrolling leaderboard: only visible rows are drawn, from cached row surfaces, and rows are fetched a page
+# at a time through SokobanGame.query_scores
+class LeaderboardView:
+    def __init__(self, game, level_id):
+        self.game = game
+        self.level_id = level_id
+        self.level = game.get_level(level_id)  # Looked up once; pack levels are decoded on each get_level miss
+        self.since = None  # Date string for "this week", None for all time
+        self.scroll = 0.0
+        self.target_scroll = 0.0
+        self.total = 0
+        self.pages = {}  # page number -> [(rank, entry), ...]
+        self.pages_version = None
+        self.row_surfaces = OrderedDict()  # (rank, username, moves, date) -> rendered row, LRU
+        self.viewport = pygame.Rect(0, 110, game.screen_width, game.screen_height - 200)
+        self.refresh()
+
+    def refresh(self):
+        self.pages = {}
+        self.total, _ = self.game.query_scores(self.level_id, 0, 0, self.since)
+        self.pages_version = self.game.score_index_version(self.level_id)
+        self.clamp_scroll()
+
+    def max_scroll(self):
+        return max(0, self.total * LEADERBOARD_ROW_HEIGHT - self.viewport.height)
+
+    def clamp_scroll(self):
+        self.target_scroll = min(max(self.target_scroll, 0), self.max_scroll())
+        self.scroll = min(max(self.scroll, 0), self.max_scroll())
+
+    def scroll_by(self, pixels):
+        self.target_scroll += pixels
+        self.clamp_scroll()
+
+    def toggle_week(self):
+        self.since = None if self.since else (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+        self.scroll = self.target_scroll = 0
+        self.refresh()
+
+    def jump_to_user(self, username):
+        rank = self.game.score_rank(self.level_id, username, self.since) if username else None
+        if rank is not None:
+            # Centre the row in the viewport
+            self.target_scroll = (rank - 1) * LEADERBOARD_ROW_HEIGHT - self.viewport.height // 2
+            self.clamp_scroll()
+        return rank
+
+    def row(self, rank):
+        page_number = (rank - 1) // LEADERBOARD_PAGE_SIZE
+        if page_number not in self.pages:
+            _, self.pages[page_number] = self.game.query_scores(
+                self.level_id, page_number * LEADERBOARD_PAGE_SIZE, LEADERBOARD_PAGE_SIZE, self.since)
+        page = self.pages[page_number]
+        index = (rank - 1) % LEADERBOARD_PAGE_SIZE
+        return page[index] if index < len(page) else None
+
+    def row_surface(self, rank, entry):
+        key = (rank, entry["username"], entry["moves"], entry.get("date", ""))
+        surface = self.row_surfaces.get(key)
+        if surface is None:
+            surface = pygame.Surface((sum(LEADERBOARD_COL_WIDTHS), LEADERBOARD_ROW_HEIGHT), pygame.SRCALPHA)
+            highlight = entry["username"] == self.game.current_user
+            if highlight:
+                surface.fill(TEXT_INPUT_ACTIVE_COLOR)
+            for col_idx, text_val in enumerate(key):
+                text_surface = self.game.small_font.render(str(text_val), True, TEXT_COLOR)
+                surface.blit(text_surface, (sum(LEADERBOARD_COL_WIDTHS[:col_idx]) + 10, 4))
+            self.row_surfaces[key] = surface
+            if len(self.row_surfaces) > LEADERBOARD_ROW_CACHE_SIZE:
+                self.row_surfaces.popitem(last=False)
+        else:
+            self.row_surfaces.move_to_end(key)
+        return surface
+
+    def draw(self, screen):
+        if self.pages_version != self.game.score_index_version(self.level_id):
+            self.refresh()  # Scores changed, cached pages may be stale
+        self.scroll += (self.target_scroll - self.scroll) * 0.3  # Ease towards the target for smooth scrolling
+        if abs(self.target_scroll - self.scroll) < 0.5:
+            self.scroll = self.target_scroll
+
+        start_x = (self.game.screen_width - sum(LEADERBOARD_COL_WIDTHS)) // 2
+        first_rank = int(self.scroll) // LEADERBOARD_ROW_HEIGHT + 1
+        last_rank = min(self.total, (int(self.scroll) + self.viewport.height) // LEADERBOARD_ROW_HEIGHT + 1)
+        blits = []
+        for rank in range(first_rank, last_rank + 1):
+            row = self.row(rank)
+            if row is None:
+                break
+            y = self.viewport.y + (rank - 1) * LEADERBOARD_ROW_HEIGHT - int(self.scroll)
+            blits.append((self.row_surface(*row), (start_x, y)))
+        screen.set_clip(self.viewport)
+        screen.blits(blits, doreturn=False)
+        screen.set_clip(None)
+
+        if self.total > 0:
+            position = f"{first_rank}-{last_rank} of {self.total}" + (" this week" if self.since else "")
+            position_surface = self.game.small_font.render(position, True, TEXT_COLOR)
+            screen.blit(position_surface, (start_x, self.viewport.bottom + 5))
+
+
+def hash_password(password, salt=None, iterations=PASSWORD_HASH_ITERATIONS):
+    # Salted and deliberately slow; stored as "pbkdf2_sha256$iterations$salt$hash"
+    salt = salt or os.urandom(PASSWORD_SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join(["pbkdf2_sha256", str(iterations), base64.b64encode(salt).decode("ascii"),
+                     base64.b64encode(digest).decode("ascii")])
+
+
+def verify_password(record, password):
+    # Returns (password matches, new hash to store or None). Older records are upgraded once the password is
+    # known: plain "password" fields and unsalted SHA-256 "password_hash" values (as in sokoban_users.json), and
+    # the salted wrappers migrate_password gives those until then
+    stored_hash = record.get("password_hash")
+    if stored_hash and stored_hash.startswith(LEGACY_HASH_PREFIX):
+        matches, _ = verify_password({"password_hash": stored_hash[len(LEGACY_HASH_PREFIX):]},
+                                     hashlib.sha256(password.encode("utf-8")).hexdigest())
+        return matches, hash_password(password) if matches else None
+    if stored_hash and stored_hash.startswith("pbkdf2_sha256$"):
+        _, iterations, salt, expected = stored_hash.split("$")
+        matches = hmac.compare_digest(hash_password(password, base64.b64decode(salt), int(iterations)), stored_hash)
+        outdated = int(iterations) < PASSWORD_HASH_ITERATIONS
+    elif stored_hash:
+        matches = hmac.compare_digest(hashlib.sha256(password.encode("utf-8")).hexdigest(), stored_hash)
+        outdated = True
+    else:
+        matches = hmac.compare_digest(record.get("password", "").encode("utf-8"), password.encode("utf-8"))
+        outdated = True
+    return matches, hash_password(password) if matches and outdated else None
+
+
+def migrate_password(record):
+    # Salted hash to store in place of a plain-text password or an unsalted SHA-256 hash, or None if the record
+    # is already salted. Without the password an unsalted hash can only be wrapped; login replaces the wrapper.
+    stored_hash = record.get("password_hash")
+    if not stored_hash:
+        return hash_password(record.get("password", ""))
+    if stored_hash.startswith("pbkdf2_sha256$") or stored_hash.startswith(LEGACY_HASH_PREFIX):
+        return None
+    return LEGACY_HASH_PREFIX + hash_password(stored_hash)
+
+
+def migrate_passwords(users, legacy_users):
+    # Runs in a PasswordTask at startup. Returns {username: (record it was made from or None, new record)}.
+    # legacy_users are users from LEGACY_USERS_FILE that aren't in USERS_FILE yet.
+    migrated = {}
+    for username, record in users.items():
+        new_hash = migrate_password(record)
+        if new_hash:
+            new_record = {key: value for key, value in record.items() if key != "password"}
+            migrated[username] = (record, dict(new_record, password_hash=new_hash))
+    for username, record in legacy_users.items():
+        migrated[username] = (None, {"password_hash": migrate_password(record),
+                                     "role": ADMIN if record.get("role") == "admin" else PLAYER})
+    return migrated
+
+
+# One slow password hash or check run off the main thread, so the login screen keeps drawing meanwhile
+class PasswordTask:
+    def __init__(self, action, username, work, *args):
+        self.action = action  # "login", "register" or "migrate"
+        self.username = username
+        self.result = None
+        self.done = False
+        threading.Thread(target=self.run, args=(work,) + args, daemon=True).start()
+
+    def run(self, work, *args):
+        self.result = work(*args)
+        self.done = True
+
+
+def write_json_atomic(path, data):
+    # Written to a temporary file and renamed over the old one, so other instances never read half a file
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"  # Sync threads may write alongside the frame loop
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def acquire_file_lock(path):
+    # Lock file next to the data file; held only for one read-merge-write
+    lock_path = path + ".lock"
+    while True:
+        try:
+            lock_fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            lock = read_file_lock(lock_path)
+            if lock and file_lock_is_stale(lock):
+                break_file_lock(lock_path, lock)
+                continue
+            time.sleep(0.005)
+            continue
+        os.write(lock_fd, f"{socket.gethostname()} {os.getpid()}".encode("utf-8"))  # Checked by file_lock_is_stale
+        held_file_locks.add(lock_path, lock_fd)
+        return lock_fd
+
+
+# Touches the lock files this process holds every DATA_LOCK_REFRESH_SECONDS. Instances on other machines can't
+# check our pid, so to them a lock stays fresh for as long as we're alive, however long the write takes.
+class HeldFileLocks:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.held = {}  # lock path -> fd
+        self.thread_pid = None  # Threads don't survive fork, so a child process starts its own
+
+    def add(self, lock_path, lock_fd):
+        with self.lock:
+            self.held[lock_path] = lock_fd
+            if self.thread_pid != os.getpid():
+                self.thread_pid = os.getpid()
+                threading.Thread(target=self.work, daemon=True).start()
+
+    def remove(self, lock_path):
+        with self.lock:
+            self.held.pop(lock_path, None)
+
+    def work(self):
+        while True:
+            time.sleep(DATA_LOCK_REFRESH_SECONDS)
+            with self.lock:
+                for lock_path, lock_fd in self.held.items():
+                    try:
+                        os.utime(lock_fd if os.utime in os.supports_fd else lock_path)
+                    except OSError:
+                        pass  # Broken as stale by someone else; release_file_lock sorts it out
+
+
+held_file_locks = HeldFileLocks()
+
+
+def read_file_lock(lock_path):
+    # (inode, mtime, "host pid") of a lock file, or None if it was released meanwhile
+    try:
+        with open(lock_path, 'r') as f:
+            stat = os.fstat(f.fileno())
+            return stat.st_ino, stat.st_mtime_ns, f.read()
+    except OSError:
+        return None
+
+
+def file_lock_is_stale(lock):
+    # Held by an exited process on this machine, or (if the holder can't be checked) not touched by its holder
+    # for DATA_LOCK_STALE_SECONDS
+    _, mtime_ns, owner = lock
+    host, _, pid = owner.rpartition(" ")
+    age = time.time() - mtime_ns / 1e9
+    if os.name == "posix" and host == socket.gethostname() and pid.isdigit():
+        try:
+            os.kill(int(pid), 0)  # Signal 0 only checks that the process exists
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass  # Exists, but belongs to another user
+        return False
+    return age > DATA_LOCK_STALE_SECONDS
+
+
+def break_file_lock(lock_path, lock):
+    # Several waiters can find the same stale lock. Each moves the lock file aside first and removes it only if
+    # it is still the lock it judged stale, so a fresh lock another waiter has just taken is never removed.
+    aside_path = f"{lock_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.rename(lock_path, aside_path)
+    except OSError:
+        return  # Already broken or released
+    if read_file_lock(aside_path) != lock:  # Replaced, written or touched since we looked: put it back
+        try:
+            os.link(aside_path, lock_path)  # Unlike rename, never replaces a lock created meanwhile
+        except OSError:
+            pass
+    os.remove(aside_path)
+
+
+def release_file_lock(path, lock_fd):
+    # Leaves the lock file alone if it isn't ours any more (broken as stale and taken by another instance)
+    lock_path = path + ".lock"
+    held_file_locks.remove(lock_path)
+    try:
+        if os.stat(lock_path).st_ino == os.fstat(lock_fd).st_ino:
+            os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+    os.close(lock_fd)
+
+
+# Notices when data files shared with other instances change on disk: one stat call per file per check
+class DataFileWatcher:
+    def __init__(self, paths):
+        self.signatures = {path: None for path in paths}  # path -> signature of the version last read or written
+
+    @staticmethod
+    def signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino  # Inode catches replace-by-rename within one mtime tick
+
+    def poll(self, path):
+        # Returns the new signature if the file changed since it was last seen, else None
+        signature = self.signature(path)
+        return signature if signature != self.signatures[path] else None
+
+    def mark_seen(self, path, signature=None):
+        self.signatures[path] = signature or self.signature(path)
+
+
+def iter_json_object(path):
+    # Yields the members of the JSON object in path one by one, reading JSON_READ_CHUNK characters at a time, so
+    # only about one member is held at once. Each raw_decode call holds the GIL for one member only, so a
+    # background thread reading a big file lets the frame loop run in between.
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        text, i = "", 0
+
+        def read_more():
+            # Drops what has been parsed and reads at least as much again as is left, so long members cost O(n)
+            nonlocal text, i
+            chunk = f.read(max(JSON_READ_CHUNK, len(text) - i))
+            text, i = text[i:] + chunk, 0
+            return bool(chunk)
+
+        def peek(separators=" \t\r\n"):
+            # Skips separators and returns the next character, or "" at the end of the file
+            nonlocal i
+            while True:
+                while i < len(text) and text[i] in separators:
+                    i += 1
+                if i < len(text) or not read_more():
+                    return text[i:i + 1]
+
+        def decode():
+            nonlocal i
+            while True:
+                try:
+                    value, end = decoder.raw_decode(text, i)
+                    if end < len(text):  # A value running to the end of the buffer may continue in the next chunk
+                        i = end
+                        return value
+                except json.JSONDecodeError:
+                    pass
+                if not read_more():
+                    value, i = decoder.raw_decode(text, i)  # Whole file read: complete, or really malformed
+                    return value
+
+        if peek() != "{":
+            raise ValueError(f"{path} doesn't hold a JSON object")
+        i += 1
+        while peek() != "}":
+            key = decode()
+            if peek() != ":":
+                raise ValueError(f"Expected ':' after {key!r} in {path}")
+            i += 1
+            peek()
+            yield key, decode()
+            peek(" \t\r\n,")
+
+
+# Reads and writes SCORES_FILE on a background thread, so a big file never stalls a frame. A save merges this
+# instance's new entries into the file under the lock. Levels read from a version of the file another instance
+# wrote go to levels_read, and the frame loop merges a few of them per frame.
+class ScoreFileSync:
+    def __init__(self, path, signature):
+        self.path = path
+        self.signature = signature  # Of the file as last read or written
+        self.lock = threading.Lock()
+        self.pending = {}  # level_id -> {username: entry} not written yet
+        self.jobs = queue.Queue()
+        self.levels_read = queue.Queue()  # (level_id, entries)
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def save(self, level_id, entry):
+        self.add_pending({level_id: {entry["username"]: entry}})
+        self.jobs.put("save")
+
+    def check(self):
+        # Re-reads the file if another instance changed it
+        self.jobs.put("check")
+
+    def wait(self):
+        self.jobs.join()
+
+    def add_pending(self, pending):
+        with self.lock:
+            for level_id, entries in pending.items():
+                level_pending = self.pending.setdefault(level_id, {})
+                for username, entry in entries.items():
+                    if username not in level_pending or entry["moves"] < level_pending[username]["moves"]:
+                        level_pending[username] = entry
+
+    def read_levels(self):
+        # Yields the file's levels, also handing them to the frame loop unless we've already seen this version
+        signature = DataFileWatcher.signature(self.path)
+        if signature is None:
+            return
+        for level_id, entries in iter_json_object(self.path):
+            if signature != self.signature:
+                self.levels_read.put((level_id, entries))
+            yield level_id, entries
+        self.signature = signature
+
+    def write(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return  # Already written along with an earlier save
+        lock_fd = acquire_file_lock(self.path)
+        try:
+            scores = dict(self.read_levels())  # Entries other instances wrote go into this write too
+            for level_id, level_pending in pending.items():
+                entries = {entry["username"]: entry for entry in scores.get(level_id, [])}
+                for username, entry in level_pending.items():
+                    if username not in entries or entry["moves"] < entries[username]["moves"]:
+                        entries[username] = entry
+                scores[level_id] = sorted(entries.values(), key=score_sort_key)
+            write_json_atomic(self.path, scores)
+            self.signature = DataFileWatcher.signature(self.path)
+        except (OSError, ValueError):
+            self.add_pending(pending)  # Kept for the next save rather than lost
+            raise
+        finally:
+            release_file_lock(self.path, lock_fd)
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job == "save":
+                    self.write()
+                elif DataFileWatcher.signature(self.path) != self.signature:
+                    for _ in self.read_levels():
+                        pass
+            except (OSError, ValueError) as e:
+                print(f"Warning: could not sync {self.path}: {e}")
+            finally:
+                self.jobs.task_done()
+
+
+def deep_sizeof(obj):
+    # Approximate bytes held by plain data: containers and what they contain, each object counted once
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(item)
+    return total
+
+
+def surface_bytes(surface):
+    # Pixel memory lives in SDL, outside what tracemalloc sees
+    return surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+# Memory accounting for long-running kiosks: sizes by subsystem, and tracemalloc snapshots compared each time
+# a screen is re-entered, so growth across e.g. play -> ESC cycles shows up with the lines that allocated it.
+# Walking every container to size it takes a while on a big catalog, so reports are made on a background thread.
+class MemoryDiagnostics:
+    def __init__(self):
+        tracemalloc.start(DIAG_TRACE_FRAMES)
+        self.live_levels = weakref.WeakSet()  # Every SokobanLevel created, for as long as something holds it
+        self.state_baselines = {}  # state -> (snapshot, traced bytes) the last time growth was measured from
+        self.last_state = None
+        self.report_requested = threading.Event()  # Set by F3 for a report now rather than at the next interval
+        self.thread = None  # Started by start()
+        self.overlay_visible = False  # Toggled with F3
+        self.report_lines = []
+        self.warnings = []
+
+    def start(self, game):
+        self.thread = threading.Thread(target=self.work, args=(game,), daemon=True)
+        self.thread.start()
+
+    def work(self, game):
+        while True:
+            self.report_requested.wait(DIAG_REPORT_MS / 1000)
+            self.report_requested.clear()
+            self.report(game)
+
+    def track_level(self, level):
+        self.live_levels.add(level)
+
+    def subsystem_sizes(self, game):
+        level_state = [{name: value for name, value in vars(level).items()
+                        if name not in ("game_manager", "screen", "font", "small_font", "tile_atlas", "telemetry")}
+                       for level in self.live_levels]
+        surfaces = [atlas for atlas, _ in game.tile_atlas.scaled.values()] + list(game.tile_atlas.ghost_scaled.values())
+        if game.editor_grid_surface:
+            surfaces.append(game.editor_grid_surface)
+        if game.editor_overlay_cache:
+            surfaces += [game.editor_overlay_cache[1]] + game.editor_overlay_cache[2]
+        if game.global_leaderboard_cache:
+            surfaces += game.global_leaderboard_cache[1]
+        if game.leaderboard_view:
+            surfaces += list(game.leaderboard_view.row_surfaces.values())
+        surfaces += list(game.thumbnails.memory.values())
+        return [
+            ("users", deep_sizeof(game.users)),
+            ("levels", deep_sizeof(game.levels) + deep_sizeof(game.level_fingerprints)),
+            ("scores", deep_sizeof(game.scores) + sum(deep_sizeof(index.keys) + sys.getsizeof(index.by_user)
+                                                      for index in game.score_indexes.values())),
+            ("global ranking", deep_sizeof(vars(game.global_leaderboard))),
+            ("hint engines", sum(deep_sizeof(vars(engine)) for engine in game.hint_engines.values())),
+            ("telemetry", sum(telemetry.visits.buffer_info()[1] * telemetry.visits.itemsize * 2
+                              for telemetry in game.telemetry.pending.values())),
+            (f"{len(level_state)} SokobanLevel", deep_sizeof(level_state)),
+            (f"{len(surfaces)} cached surfaces", sum(map(surface_bytes, surfaces))),
+            ("3 fonts", sum(sys.getsizeof(font) for font in (game.font, game.small_font, game.message_font))),
+        ]
+
+    def report(self, game):
+        for _ in range(DIAG_REPORT_ATTEMPTS):
+            try:
+                sizes = self.subsystem_sizes(game)
+                break
+            except RuntimeError:
+                pass  # A dict or set changed size while we walked it; start over
+        else:
+            self.warn("Memory report skipped: data kept changing while it was measured")
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        report_lines = [f"Python heap: {format_bytes(current)} (peak {format_bytes(peak)})"]
+        report_lines += [f"{name}: {format_bytes(size)}" for name, size in sizes]
+        self.report_lines = report_lines  # Swapped in whole, so draw never sees half a report
+        print("[memory] " + " | ".join(report_lines))
+
+    def warn(self, message):
+        print(f"[memory] WARNING: {message}")
+        self.warnings = (self.warnings + [message])[-3:]
+
+    def check_state_change(self, game):
+        # Called every frame; only does work when the UI state has changed
+        state = game.current_state
+        if state == self.last_state:
+            return
+        self.last_state = state
+        gc.collect()  # Only count what is really still referenced
+        if state != "game" and len(self.live_levels) > 1:  # game_instance keeps the last level alive
+            self.warn(f"{len(self.live_levels)} SokobanLevel instances alive on '{state}'")
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        traced = tracemalloc.get_traced_memory()[0]
+        if state not in self.state_baselines:
+            self.state_baselines[state] = (snapshot, traced)
+            return
+        baseline, baseline_traced = self.state_baselines[state]
+        if traced - baseline_traced > DIAG_GROWTH_BYTES:
+            self.warn(f"'{state}' grew by {format_bytes(traced - baseline_traced)} since it was last measured")
+            for stat in snapshot.compare_to(baseline, "lineno")[:DIAG_TOP_STATS]:
+                print(f"[memory]   {stat}")
+            self.state_baselines[state] = (snapshot, traced)  # Flag further growth from here
+
+    def update(self, game):
+        self.check_state_change(game)
+
+    def draw(self, game):
+        if not self.overlay_visible:
+            return
+        lines = self.report_lines + [f"! {warning}" for warning in self.warnings]
+        panel = pygame.Surface((360, 8 + 20 * len(lines)), pygame.SRCALPHA)
+        panel.fill((255, 255, 255, 220))
+        for i, line in enumerate(lines):
+            color = MESSAGE_COLOR if line.startswith("!") else TEXT_COLOR
+            panel.blit(game.small_font.render(line, True, color), (6, 4 + 20 * i))
+        game.screen.blit(panel, (game.screen_width - panel.get_width() - 5, 5))
+
+
+# Play statistics for one level: per-tile counters in flat arrays indexed row * cols + col, plus totals
+class LevelTelemetry:
+    COUNTERS = ("plays", "restarts", "abandons", "solves", "solve_seconds")
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.reset()
+
+    def reset(self):
+        self.visits = array('I', bytes(4 * self.rows * self.cols))  # Player steps onto the tile
+        self.pushes = array('I', bytes(4 * self.rows * self.cols))  # A box is pushed onto the tile
+        self.counts = dict.fromkeys(self.COUNTERS, 0)
+
+    def is_empty(self):
+        # Counting carries on after a flush mid-game, so plays alone can be 0 while moves are still being counted
+        return not (any(self.counts.values()) or any(self.visits) or any(self.pushes))
+
+    def copy(self):
+        telemetry = LevelTelemetry(self.rows, self.cols)
+        telemetry.visits = array('I', self.visits)
+        telemetry.pushes = array('I', self.pushes)
+        telemetry.counts = dict(self.counts)
+        return telemetry
+
+    def merge(self, other):
+        for i in range(len(self.visits)):
+            self.visits[i] += other.visits[i]
+            self.pushes[i] += other.pushes[i]
+        for name in self.COUNTERS:
+            self.counts[name] += other.counts[name]
+
+    def to_json(self):
+        return dict(self.counts, rows=self.rows, cols=self.cols,
+                    visits=base64.b64encode(self.visits.tobytes()).decode("ascii"),
+                    pushes=base64.b64encode(self.pushes.tobytes()).decode("ascii"))
+
+    @classmethod
+    def from_json(cls, data):
+        telemetry = cls(data["rows"], data["cols"])
+        telemetry.visits = array('I', base64.b64decode(data["visits"]))
+        telemetry.pushes = array('I', base64.b64decode(data["pushes"]))
+        for name in cls.COUNTERS:
+            telemetry.counts[name] = data.get(name, 0)
+        return telemetry
+
+
+# Telemetry counted in memory by SokobanLevel and merged into TELEMETRY_FILE every TELEMETRY_FLUSH_MS. The merge
+# runs on a background thread, so reading and rewriting the file never holds up a frame.
+class TelemetryStore:
+    def __init__(self, path):
+        self.path = path
+        self.pending = {}  # level_id -> LevelTelemetry counted since the last flush
+        self.next_flush_ticks = pygame.time.get_ticks() + TELEMETRY_FLUSH_MS
+        self.lock = threading.Lock()  # Held while the file is replaced and the batch it holds leaves unwritten
+        self.unwritten = []  # {level_id: LevelTelemetry} batches flushed but not in the file yet
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def level(self, level_id, rows, cols):
+        telemetry = self.pending.get(level_id)
+        if telemetry is None or (telemetry.rows, telemetry.cols) != (rows, cols):
+            telemetry = self.pending[level_id] = LevelTelemetry(rows, cols)
+        return telemetry
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def totals(self, level_id, rows, cols):
+        # Everything recorded for a level on disk, plus what hasn't been written yet
+        totals = LevelTelemetry(rows, cols)
+        with self.lock:
+            stored = self.read().get(level_id)
+            unwritten = [batch.get(level_id) for batch in self.unwritten]
+        if stored and (stored["rows"], stored["cols"]) == (rows, cols):
+            totals = LevelTelemetry.from_json(stored)
+        for pending in unwritten + [self.pending.get(level_id)]:
+            if pending and (pending.rows, pending.cols) == (rows, cols):
+                totals.merge(pending)
+        return totals
+
+    def flush(self):
+        # Hands what was counted since the last flush to the writer thread
+        self.next_flush_ticks = pygame.time.get_ticks() + TELEMETRY_FLUSH_MS
+        batch = {level_id: telemetry.copy() for level_id, telemetry in self.pending.items() if not telemetry.is_empty()}
+        if not batch:
+            return
+        for level_id in batch:
+            self.pending[level_id].reset()  # Levels being played keep counting into the same object
+        with self.lock:
+            self.unwritten.append(batch)
+        self.jobs.put(batch)
+
+    def wait(self):
+        self.jobs.join()
+
+    def work(self):
+        while True:
+            batch = self.jobs.get()
+            try:
+                self.write(batch)
+            except OSError as e:
+                print(f"Warning: could not save telemetry: {e}")
+                with self.lock:
+                    self.unwritten.remove(batch)
+            finally:
+                self.jobs.task_done()
+
+    def write(self, batch):
+        lock_fd = acquire_file_lock(self.path)
+        try:
+            stored = self.read()
+            for level_id, telemetry in batch.items():
+                old = stored.get(level_id)
+                if old and (old["rows"], old["cols"]) == (telemetry.rows, telemetry.cols):
+                    merged = LevelTelemetry.from_json(old)
+                    merged.merge(telemetry)
+                else:  # New level, or the level was edited and the old tiles no longer line up
+                    merged = telemetry
+                stored[level_id] = merged.to_json()
+            with self.lock:  # totals never sees the batch both in the file and in unwritten
+                write_json_atomic(self.path, stored)
+                self.unwritten.remove(batch)
+        finally:
+            release_file_lock(self.path, lock_fd)
+
+
+# Sorted keys in buckets of about RANK_BUCKET_SIZE, with a Fenwick tree over the bucket sizes, so inserting,
+# removing and finding a key's rank cost O(log n + bucket size) instead of shifting one big list
+class RankedKeys:
+    def __init__(self, keys=()):
+        self.rebuild(sorted(keys))
+
+    def rebuild(self, sorted_keys):
+        self.buckets = [sorted_keys[i:i + RANK_BUCKET_SIZE] for i in range(0, len(sorted_keys), RANK_BUCKET_SIZE)]
+        self.build_index()
+
+    def build_index(self):
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.tree = [0] * (len(self.buckets) + 1)  # Fenwick tree: tree[i] sums a run of bucket sizes ending at i
+        for i, bucket in enumerate(self.buckets):
+            self.tree_add(i, len(bucket))
+        self.size = sum(map(len, self.buckets))
+
+    def tree_add(self, i, delta):
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def tree_prefix(self, i):
+        # Number of keys in buckets 0 .. i - 1
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+    def insert(self, key):
+        if not self.buckets:
+            self.rebuild([key])
+            return
+        i = min(bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[i]
+        insort(bucket, key)
+        self.maxes[i] = bucket[-1]
+        self.size += 1
+        if len(bucket) >= 2 * RANK_BUCKET_SIZE:
+            self.buckets[i:i + 1] = [bucket[:RANK_BUCKET_SIZE], bucket[RANK_BUCKET_SIZE:]]
+            self.build_index()  # O(number of buckets), once per RANK_BUCKET_SIZE inserts into a bucket
+        else:
+            self.tree_add(i, 1)
+
+    def remove(self, key):
+        i = bisect_left(self.maxes, key)
+        bucket = self.buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        self.size -= 1
+        if not bucket:
+            del self.buckets[i]
+            self.build_index()
+        else:
+            self.maxes[i] = bucket[-1]
+            self.tree_add(i, -1)
+
+    def replace(self, old_keys, new_keys):
+        # Swaps a batch of keys; a big batch is cheaper as one re-sort than as many single moves
+        if len(old_keys) + len(new_keys) > self.size // RANK_REBUILD_FRACTION:
+            removed = set(old_keys)
+            self.rebuild(sorted([key for key in self if key not in removed] + list(new_keys)))
+            return
+        for key in old_keys:
+            self.remove(key)
+        for key in new_keys:
+            self.insert(key)
+
+    def rank(self, key):
+        # Number of keys that sort before key
+        i = bisect_left(self.maxes, key)
+        if i == len(self.buckets):
+            return self.size
+        return self.tree_prefix(i) + bisect_left(self.buckets[i], key)
+
+    def first(self, count):
+        keys = []
+        for bucket in self.buckets:
+            if len(keys) >= count:
+                break
+            keys.extend(bucket[:count - len(keys)])
+        return keys
+
+
+# Cross-level ranking kept up to date entry by entry, so it never has to be rebuilt from scores.json
+class GlobalLeaderboard:
+    def __init__(self):
+        self.level_best = {}  # level_id -> best moves on that level
+        self.level_moves = {}  # level_id -> {username: best moves of that user}
+        self.stats = {}  # username -> [levels_solved, total_moves, points]
+        self.ranking = RankedKeys()  # Rank keys of every user, see rank_key
+        self.version = 0  # Bumped on every change so cached UI text knows when to re-render
+
+    @staticmethod
+    def level_points(best_moves, moves):
+        return GLOBAL_POINTS_PER_LEVEL * best_moves // max(moves, 1)
+
+    def rank_key(self, username):
+        levels_solved, total_moves, points = self.stats[username]
+        return -points, -levels_solved, total_moves, username
+
+    def build(self, scores):
+        # One pass over the loaded scores at startup; later changes go through record()
+        for level_id, entries in scores.items():
+            for entry in entries:
+                user_moves = self.level_moves.setdefault(level_id, {})
+                old_moves = user_moves.get(entry["username"])
+                if old_moves is None or entry["moves"] < old_moves:
+                    user_moves[entry["username"]] = entry["moves"]
+        for level_id, user_moves in self.level_moves.items():
+            best = min(user_moves.values())
+            self.level_best[level_id] = best
+            for username, moves in user_moves.items():
+                stats = self.stats.setdefault(username, [0, 0, 0])
+                stats[0] += 1
+                stats[1] += moves
+                stats[2] += self.level_points(best, moves)
+        self.ranking = RankedKeys(self.rank_key(username) for username in self.stats)
+        self.version += 1
+
+    def record(self, level_id, username, moves):
+        # Returns False if this isn't an improvement for the user on that level
+        return self.record_many(level_id, [(username, moves)]) > 0
+
+    def record_many(self, level_id, results):
+        # results: (username, moves) pairs on one level. Everyone whose points change is re-ranked in one batch;
+        # returns how many users improved.
+        user_moves = self.level_moves.setdefault(level_id, {})
+        improved = {}
+        for username, moves in results:
+            old_moves = improved.get(username, user_moves.get(username))
+            if old_moves is None or moves < old_moves:
+                improved[username] = moves
+        if not improved:
+            return 0
+
+        old_best = self.level_best.get(level_id)
+        best = min(improved.values())
+        if old_best is not None and old_best < best:
+            best = old_best
+        # A new level record changes everyone's points on this level; otherwise only the improved users' change
+        affected = set(user_moves) | set(improved) if best != old_best else set(improved)
+        old_keys, new_keys = [], []
+        for username in affected:
+            if username in self.stats:
+                old_keys.append(self.rank_key(username))
+            stats = self.stats.setdefault(username, [0, 0, 0])
+            old_moves = user_moves.get(username)
+            moves = improved.get(username, old_moves)
+            if old_moves is None:
+                stats[0] += 1
+                stats[1] += moves
+            else:
+                stats[1] += moves - old_moves
+                stats[2] -= self.level_points(old_best, old_moves)
+            stats[2] += self.level_points(best, moves)
+            user_moves[username] = moves
+            new_keys.append(self.rank_key(username))
+        self.level_best[level_id] = best
+        self.ranking.replace(old_keys, new_keys)
+        self.version += 1
+        return len(improved)
+
+    def top(self, count):
+        return [(rank + 1, key[3], self.stats[key[3]]) for rank, key in enumerate(self.ranking.first(count))]
+
+    def rank_of(self, username):
+        if username not in self.stats:
+            return None
+        return self.ranking.rank(self.rank_key(username)) + 1
+
 
 # Game setup
 class SokobanGame:
-    def __init__(self):
+    def __init__(self, diagnostics=False, headless=False):
+        # headless: draw to an off-screen surface instead of opening a window (used by load-test kiosks)
+        self.diagnostics = MemoryDiagnostics() if diagnostics else None  # Started first so setup is traced too
         self.current_user = None
         self.user_role = ANONYMOUS
+        self.data_watcher = DataFileWatcher([USERS_FILE, LEVELS_FILE, SCORES_FILE])
+        self.next_data_poll_ticks = 0
         self.users = self.load_users()
+        self.password_migration = self.start_password_migration()  # PasswordTask, or None if nothing to migrate
         self.levels = self.load_levels()
+        self.level_pack = self.open_level_pack()  # Optional imported collection, read on demand
+        self.level_fingerprints = {}  # level_fingerprint -> IDs of levels in levels.json with that layout
+        for level_id, level_data in self.levels.items():
+            self.level_fingerprints.setdefault(level_fingerprint(level_data["data"]), []).append(level_id)
+        self.pending_duplicate_fingerprint = None  # Set when a save was refused as a duplicate
         self.scores = self.load_scores()
+        self.score_sync = ScoreFileSync(SCORES_FILE, self.data_watcher.signatures[SCORES_FILE])
+        self.global_leaderboard = GlobalLeaderboard()
+        self.global_leaderboard.build(self.scores)
+        self.global_leaderboard_cache = None  # (cache key, rendered row surfaces)
+        self.score_indexes = {}  # level_id -> LevelScoreIndex, built the first time a level's scores are used
+        self.leaderboard_view = None
+        self.hint_engines = OrderedDict()  # (level_id, level rows) -> HintEngine, kept across resets; LRU order
+        self.hint_worker = None  # Started on the first hint request
+        self.telemetry = TelemetryStore(TELEMETRY_FILE)  # Only filled for players who opted in
+        self.heatmap = None  # (level_id, LevelTelemetry totals, "visits" or "pushes") on the admin heatmap screen
+        self.level_action_prefix = "play_level_"  # What clicking a level on the level selection screen does
+        self.level_page = 0  # Page of the level selection screen, kept when levels saved elsewhere show up
+        self.password_task = None  # PasswordTask for the login or registration in progress
+        self.session_key = None  # Loaded the first time a session token is signed or checked
 
         # Level editor properties
         self.editor_tool = 1  # 1: wall, 2: box, 3: target, 4: player, 0: erase
         self.editor_level_chars = [[' ' for _ in range(EDITOR_GRID_COLS)] for _ in range(EDITOR_GRID_ROWS)]
         self.editor_player_pos_rc = None  # Store as (row, col) for the char grid
+        self.editor_analysis = EditorAnalysis(self.editor_level_chars)  # Live overlay data for the design
+        self.editor_overlay_cache = None  # (analysis version, overlay surface, status line surfaces)
 
         # UI setup
         self.screen_width = 800
         self.screen_height = 600
-        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
-        pygame.display.set_caption("Multi-User Sokoban")
+        if headless:
+            self.screen = pygame.Surface((self.screen_width, self.screen_height))
+        else:
+            self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
+            pygame.display.set_caption("Multi-User Sokoban")
+        self.tile_atlas = TileAtlas()  # Built after set_mode so tiles can be converted to the display format
+        self.thumbnails = ThumbnailCache()
+        self.autosave_writer = AutosaveWriter()
+        self.next_autosave_ticks = 0
+        self.saved_games = {}  # username -> [level_id, content hash, steps] as last autosaved, or None; see saved_game
+        self.editor_grid_surface = None  # Grid lines are drawn once, then blitted
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont(None, 36)
         self.small_font = pygame.font.SysFont(None, 24)
@@ -73,26 +2130,77 @@ class SokobanGame:
 
         self.setup_login_ui()
 
+    def get_hint_engine(self, level):
+        engine_key = (level.level_id, tuple(level.level))
+        if engine_key not in self.hint_engines:
+            self.hint_engines[engine_key] = HintEngine(level.level, level.walls_set, level.targets_rc)
+            if len(self.hint_engines) > HINT_ENGINE_CACHE_SIZE:
+                self.hint_engines.popitem(last=False)
+        self.hint_engines.move_to_end(engine_key)
+        if self.hint_worker is None:
+            self.hint_worker = HintWorker()
+        return self.hint_engines[engine_key]
+
+    def level_telemetry(self, level_id, rows, cols):
+        # The buffer a level counts into, or None if the player hasn't opted in
+        if not (self.current_user and self.users.get(self.current_user, {}).get("telemetry")):
+            return None
+        return self.telemetry.level(level_id, rows, cols)
+
+    def toggle_telemetry(self):
+        telemetry = not self.users[self.current_user].get("telemetry")
+        self.save_users(self.current_user, {"telemetry": telemetry})
+        self.setup_menu_ui()
+        self.set_ui_message("Sharing play statistics." if telemetry else "Play statistics off.", 120)
+
     def set_ui_message(self, msg, duration=180):  # duration in frames (3 seconds at 60fps)
         self.ui_message = msg
         self.ui_message_timer = duration
 
-    def load_users(self):
+    def read_data_file(self, path):
+        # Returns the file's contents, or None if it's missing, unreadable or unchanged since last seen
+        signature = self.data_watcher.poll(path)
+        if signature is None:
+            return None
+        self.data_watcher.mark_seen(path, signature)
         try:
-            with open('users.json', 'r') as f:
+            with open(path, 'r') as f:
                 return json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
-            return {"admin": {"password": "admin123", "role": ADMIN}}
+            return None
 
-    def save_users(self):
-        with open('users.json', 'w') as f:
-            json.dump(self.users, f, indent=4)
+    def load_users(self):
+        users = self.read_data_file(USERS_FILE)
+        if users is None:
+            return {"admin": {"password": "admin123", "role": ADMIN}}  # Hashed by the migration at startup
+        return users
 
-    def load_levels(self):
+    def reload_users(self):
+        disk_users = self.read_data_file(USERS_FILE)
+        if disk_users:
+            self.users.update(disk_users)  # Records edited elsewhere are newer than ours
+
+    def save_users(self, username, fields, new_user=False, remove=()):
+        # Updates only the given fields of one user's record, on top of whatever another instance last wrote to it;
+        # returns False if new_user and another instance registered the name first
+        lock_fd = acquire_file_lock(USERS_FILE)
         try:
-            with open('levels.json', 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
+            self.reload_users()
+            if new_user and username in self.users:
+                return False
+            record = dict(self.users.get(username, {}), **fields)
+            for key in remove:
+                record.pop(key, None)
+            self.users[username] = record
+            write_json_atomic(USERS_FILE, self.users)
+            self.data_watcher.mark_seen(USERS_FILE)
+            return True
+        finally:
+            release_file_lock(USERS_FILE, lock_fd)
+
+    def load_levels(self):
+        levels = self.read_data_file(LEVELS_FILE)
+        if levels is None:
             return {
                 "0": {
                     "name": "Default Level",
@@ -105,23 +2213,97 @@ class SokobanGame:
                     "date": datetime.now().strftime("%Y-%m-%d")
                 }
             }
+        return levels
 
-    def save_levels(self):
-        with open('levels.json', 'w') as f:
-            json.dump(self.levels, f, indent=4)
+    def open_level_pack(self):
+        if not os.path.exists(LEVEL_PACK_FILE):
+            return None
+        try:
+            return LevelPack(LEVEL_PACK_FILE)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Warning: could not open level pack: {e}")
+            return None
 
-    def load_scores(self):
+    def get_level(self, level_id):
+        # Levels from levels.json, or a single level decoded straight out of the memory-mapped pack
+        if level_id in self.levels:
+            return self.levels[level_id]
+        if self.level_pack and level_id.startswith(LEVEL_PACK_ID_PREFIX):
+            number = level_id[len(LEVEL_PACK_ID_PREFIX):]
+            if number.isdigit() and int(number) < len(self.level_pack):
+                return self.level_pack.get_level(int(number))
+        return None
+
+    def reload_levels(self):
+        # Returns True if any level was added or changed by another instance
+        disk_levels = self.read_data_file(LEVELS_FILE)
+        changed = False
+        for level_id, level_data in (disk_levels or {}).items():
+            old_level = self.levels.get(level_id)
+            if old_level == level_data:
+                continue
+            if old_level:
+                self.level_fingerprints[level_fingerprint(old_level["data"])].remove(level_id)
+            self.levels[level_id] = level_data
+            self.level_fingerprints.setdefault(level_fingerprint(level_data["data"]), []).append(level_id)
+            changed = True
+        return changed
+
+    def save_levels(self, new_level=None):
+        # new_level is given its ID only once the lock is held, so two instances can't both claim the same one
+        lock_fd = acquire_file_lock(LEVELS_FILE)
         try:
-            with open('scores.json', 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+            self.reload_levels()
+            new_level_id = None
+            if new_level:
+                new_level_id = str(max([int(k) for k in self.levels.keys() if k.isdigit()] + [-1]) + 1)
+                self.levels[new_level_id] = new_level
+                self.level_fingerprints.setdefault(level_fingerprint(new_level["data"]), []).append(new_level_id)
+            write_json_atomic(LEVELS_FILE, self.levels)
+            self.data_watcher.mark_seen(LEVELS_FILE)
+            return new_level_id
+        finally:
+            release_file_lock(LEVELS_FILE, lock_fd)
 
-    def save_scores(self):
-        with open('scores.json', 'w') as f:
-            json.dump(self.scores, f, indent=4)
+    def load_scores(self):
+        scores = self.read_data_file(SCORES_FILE)
+        return {} if scores is None else scores
 
-    def register_user(self, username, password):
+    def reload_scores(self):
+        # The sync thread re-reads the file if it changed; merge_read_scores picks up what it read
+        self.score_sync.check()
+
+    def merge_read_scores(self):
+        # Called every frame. Scores only ever improve, so merging keeps each user's best entry per level from
+        # either side; a big file is merged over several frames.
+        deadline = time.perf_counter() + SCORE_MERGE_BUDGET_MS / 1000
+        while time.perf_counter() < deadline:
+            try:
+                level_id, entries = self.score_sync.levels_read.get_nowait()
+            except queue.Empty:
+                return
+            score_index = self.get_score_index(level_id)
+            improved = []
+            for entry in entries:
+                current_entry = score_index.by_user.get(entry["username"])
+                if current_entry is None or entry["moves"] < current_entry["moves"]:
+                    score_index.put(entry)
+                    improved.append((entry["username"], entry["moves"]))
+            self.global_leaderboard.record_many(level_id, improved)  # Re-ranks the level's users once, not per entry
+
+    def poll_data_files(self):
+        # Called every frame; actually stats the files once per DATA_POLL_INTERVAL_MS
+        now = pygame.time.get_ticks()
+        if now < self.next_data_poll_ticks:
+            return
+        self.next_data_poll_ticks = now + DATA_POLL_INTERVAL_MS
+        self.reload_users()
+        self.reload_scores()
+        if self.reload_levels() and self.current_state in ("level_selection", "leaderboard_level_select"):
+            # Show levels saved elsewhere, staying on the page the user is looking at
+            self.setup_level_selection_ui(page=self.level_page, action_prefix=self.level_action_prefix)
+
+    def check_registration(self, username, password):
         if not username or not password:
             return False, "Username and password cannot be empty."
         if username in self.users:
@@ -130,54 +2312,326 @@ class SokobanGame:
             return False, "Username too short (min 3 chars)."
         if len(password) < 4:
             return False, "Password too short (min 4 chars)."
+        return True, ""
 
-        self.users[username] = {"password": password, "role": PLAYER}  # Passwords should be hashed in a real app
-        self.save_users()
+    def register_user(self, username, password):
+        # Synchronous version for scripts; the login screen hashes in a PasswordTask and then calls create_user
+        ok, message = self.check_registration(username, password)
+        if not ok:
+            return False, message
+        return self.create_user(username, hash_password(password))
+
+    def create_user(self, username, password_hash):
+        if not self.save_users(username, {"password_hash": password_hash, "role": PLAYER}, new_user=True):
+            return False, "Username already exists."
         return True, "Registration successful. Please login."
 
     def login_user(self, username, password):
+        # Synchronous version for scripts; the login screen runs verify_password in a PasswordTask instead
         if username not in self.users:
             return False, "User not found."
-        # Passwords should be hashed and verified, not stored plain
-        if self.users[username]["password"] != password:
-            return False, "Incorrect password."
+        return self.finish_login(username, *verify_password(self.users[username], password))
 
+    def finish_login(self, username, matches, new_hash):
+        if not matches:
+            return False, "Incorrect password."
+        if new_hash:  # Replace a plain or legacy password with a salted hash now that we know it
+            self.save_users(username, {"password_hash": new_hash}, remove=("password",))
         self.current_user = username
         self.user_role = self.users[username]["role"]
+        self.saved_games.pop(username, None)  # Re-read: they may have played on another kiosk since
+        if self.user_role != ADMIN:  # Admins always type their password
+            self.save_session(username)
         return True, f"Login successful. Welcome, {username}!"
 
-    def add_score(self, level_id, moves):
+    def start_password_task(self, action, username, password):
+        if self.password_task:
+            return  # One check at a time
+        if action == "login":
+            if username not in self.users:
+                self.set_ui_message("User not found.")
+                return
+            self.password_task = PasswordTask(action, username, verify_password, self.users[username], password)
+            self.set_ui_message("Checking password...", 600)
+        else:
+            ok, message = self.check_registration(username, password)
+            if not ok:
+                self.set_ui_message(message)
+                return
+            self.password_task = PasswordTask(action, username, hash_password, password)
+            self.set_ui_message("Creating account...", 600)
+
+    def start_password_migration(self):
+        try:
+            with open(LEGACY_USERS_FILE, 'r') as f:
+                legacy_users = {username: record for username, record in json.load(f).items()
+                                if username not in self.users}
+        except (FileNotFoundError, json.JSONDecodeError):
+            legacy_users = {}
+        if not legacy_users and all(migrate_password(record) is None for record in self.users.values()):
+            return None
+        return PasswordTask("migrate", None, migrate_passwords, dict(self.users), legacy_users)
+
+    def finish_password_migration(self, migrated):
+        # Stores the migrated records, skipping any that another instance or a login changed in the meantime
+        lock_fd = acquire_file_lock(USERS_FILE)
+        try:
+            self.reload_users()
+            for username, (old_record, new_record) in migrated.items():
+                if self.users.get(username) == old_record:
+                    self.users[username] = new_record
+            write_json_atomic(USERS_FILE, self.users)
+            self.data_watcher.mark_seen(USERS_FILE)
+        finally:
+            release_file_lock(USERS_FILE, lock_fd)
+
+    def poll_password_task(self):
+        migration = self.password_migration
+        if migration and migration.done:
+            self.password_migration = None
+            self.finish_password_migration(migration.result)
+        task = self.password_task
+        if not task or not task.done:
+            return
+        self.password_task = None
+        if task.action == "login":
+            success, message = self.finish_login(task.username, *task.result)
+            self.set_ui_message(message)
+            if success:
+                self.setup_menu_ui()
+                self.current_state = "menu"
+        else:
+            success, message = self.create_user(task.username, task.result)
+            self.set_ui_message(message)
+            if success and self.current_state == "login":  # Clear fields on success
+                self.text_inputs["username"]["text"] = ""
+                self.text_inputs["password"]["text"] = ""
+
+    def autosave_path(self, username):
+        safe_name = "".join(char if char.isalnum() else "_" for char in username)[:20]
+        return os.path.join(AUTOSAVE_DIR, f"{safe_name}-{hashlib.sha1(username.encode('utf-8')).hexdigest()[:8]}.log")
+
+    def autosave_game(self, force=False, finished=False):
+        # Appends the moves made since the last save; finished marks the game as no longer resumable
+        level = self.game_instance
+        if not (self.current_user and level and level.valid_level):
+            return
+        now = pygame.time.get_ticks()
+        if not (force or finished) and now < self.next_autosave_ticks:
+            return
+        self.next_autosave_ticks = now + AUTOSAVE_INTERVAL_MS
+        records = []
+        truncate = not level.autosave_started
+        if truncate:
+            if finished or not level.move_log:
+                return  # Nothing worth resuming; leave any older save alone
+            records.append({"level": level.level_id, "hash": level_content_hash(level.level)})
+            level.autosave_started = True
+        if level.autosave_undos:
+            records.append({"undo": level.autosave_undos})
+            level.autosave_undos = 0
+        if len(level.move_log) > level.autosave_synced:
+            records.append({"moves": encode_run(level.move_log[level.autosave_synced:])})
+            level.autosave_synced = len(level.move_log)
+        if finished:
+            records.append({"done": True})
+        if records:
+            self.autosave_writer.write(self.autosave_path(self.current_user), records, truncate)
+            # What the log will hold once the writer gets to it, for the Resume button meanwhile
+            self.saved_games[self.current_user] = None if finished else [
+                level.level_id, level_content_hash(level.level), list(level.move_log)]
+
+    def saved_game(self):
+        # (level_id, steps) of the current user's unfinished game, if its level still has the same layout
+        if not self.current_user:
+            return None
+        if self.current_user not in self.saved_games:  # Read once after login; kept up to date by autosave_game
+            self.saved_games[self.current_user] = read_autosave(self.autosave_path(self.current_user))
+        saved = self.saved_games[self.current_user]
+        if not saved:
+            return None
+        level_id, content_hash, steps = saved
+        level_data = self.get_level(level_id)
+        if not level_data or level_content_hash(level_data["data"]) != content_hash:
+            return None  # The level was edited or removed since
+        return level_id, steps
+
+    def resume_game(self):
+        saved = self.saved_game()
+        if not saved:
+            self.set_ui_message("Nothing to resume.")
+            return False
+        level_id, steps = saved
+        self.current_level_id_playing = level_id
+        self.game_instance = SokobanLevel(self, level_id)
+        self.game_instance.replay(steps)
+        self.game_instance.autosave_started = True  # Keep appending to the same log
+        self.game_instance.autosave_synced = len(self.game_instance.move_log)
+        return True
+
+    def get_session_key(self):
+        # Random per-machine key that signs session tokens; created with owner-only permissions on first use
+        if self.session_key is None:
+            lock_fd = acquire_file_lock(SESSION_KEY_FILE)  # Two kiosks starting together must end up with one key
+            try:
+                with open(SESSION_KEY_FILE, 'rb') as f:
+                    self.session_key = f.read()
+            except FileNotFoundError:
+                self.session_key = os.urandom(32)
+                fd = os.open(SESSION_KEY_FILE, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(self.session_key)
+            finally:
+                release_file_lock(SESSION_KEY_FILE, lock_fd)
+        return self.session_key
+
+    def session_signature(self, username, expires):
+        # Bound to this machine and the stored password hash, so changing the password ends existing sessions
+        credential = self.users[username].get("password_hash", "")
+        message = f"{socket.gethostname()}|{username}|{expires}|{credential}".encode("utf-8")
+        return hmac.new(self.get_session_key(), message, hashlib.sha256).hexdigest()
+
+    def load_sessions(self):
+        try:
+            with open(SESSION_FILE, 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save_session(self, username):
+        # Replaces this machine's session: only the last player here can continue without their password
+        expires = int(time.time()) + SESSION_LIFETIME_DAYS * 86400
+        signature = self.session_signature(username, expires)
+        lock_fd = acquire_file_lock(SESSION_FILE)
+        try:
+            sessions = self.load_sessions()
+            sessions[socket.gethostname()] = {"username": username, "expires": expires, "signature": signature}
+            write_json_atomic(SESSION_FILE, sessions)
+        finally:
+            release_file_lock(SESSION_FILE, lock_fd)
+
+    def end_session(self, username):
+        # On logout; leaves the session alone if another player has logged in here since
+        lock_fd = acquire_file_lock(SESSION_FILE)
+        try:
+            sessions = self.load_sessions()
+            if sessions.get(socket.gethostname(), {}).get("username") == username:
+                del sessions[socket.gethostname()]
+                write_json_atomic(SESSION_FILE, sessions)
+        finally:
+            release_file_lock(SESSION_FILE, lock_fd)
+
+    def session_user(self):
+        # The player who can continue on this machine: token unexpired, correctly signed, still matching their
+        # account, and not an admin. None if there is no such player.
+        session = self.load_sessions().get(socket.gethostname())
+        if not isinstance(session, dict) or "username" not in session:
+            return None
+        username = session["username"]
+        if username not in self.users or self.users[username]["role"] == ADMIN or session["expires"] <= time.time():
+            return None
+        if not hmac.compare_digest(self.session_signature(username, session["expires"]), session["signature"]):
+            return None
+        return username
+
+    def resume_session(self):
+        username = self.session_user()
+        if username is None:
+            return False, "Session expired, please log in."
+        self.current_user = username
+        self.user_role = self.users[username]["role"]
+        self.saved_games.pop(username, None)  # Re-read: they may have played on another kiosk since
+        self.save_session(username)  # Sliding expiry
+        return True, f"Welcome back, {username}!"
+
+    def add_score(self, level_id, moves, run=None):
+        # run: the solution as encoded by encode_run, kept for ghost replays
         if self.current_user is None:  # Guests don't save scores
             return
 
         level_id_str = str(level_id)
-        if level_id_str not in self.scores:
-            self.scores[level_id_str] = []
+        score_index = self.get_score_index(level_id_str)
 
         # Check if user already has a score for this level, update if new one is better
-        existing_score_idx = -1
-        for i, score_entry in enumerate(self.scores[level_id_str]):
-            if score_entry["username"] == self.current_user:
-                existing_score_idx = i
-                break
-
-        if existing_score_idx != -1:
-            if moves < self.scores[level_id_str][existing_score_idx]["moves"]:
-                self.scores[level_id_str][existing_score_idx]["moves"] = moves
-                self.scores[level_id_str][existing_score_idx]["date"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-            else:
-                return  # Not a better score
-        else:
-            self.scores[level_id_str].append({
-                "username": self.current_user,
-                "moves": moves,
-                "date": datetime.now().strftime("%Y-%m-%d %H:%M")
-            })
+        existing_entry = score_index.by_user.get(self.current_user)
+        if existing_entry is not None and moves >= existing_entry["moves"]:
+            return  # Not a better score
 
-        self.scores[level_id_str].sort(key=lambda x: x["moves"])
-        self.save_scores()
+        new_entry = {
+            "username": self.current_user,
+            "moves": moves,
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M")
+        }
+        if run:
+            new_entry["run"] = run
+        score_index.put(new_entry)  # Replaces the old entry and keeps the list sorted
+        self.global_leaderboard.record(level_id_str, self.current_user, moves)
+        self.score_sync.save(level_id_str, new_entry)  # Written to the file by the sync thread
         self.set_ui_message(f"Score of {moves} saved for this level!", 120)
 
+    def get_score_index(self, level_id_str):
+        if level_id_str not in self.score_indexes:
+            self.score_indexes[level_id_str] = LevelScoreIndex(self.scores.setdefault(level_id_str, []))
+        return self.score_indexes[level_id_str]
+
+    def score_index_version(self, level_id_str):
+        return self.get_score_index(level_id_str).version
+
+    def query_scores(self, level_id_str, offset, limit, since=None):
+        # One page of a level's leaderboard: (total matching, [(rank, entry), ...]); since filters by date
+        return self.get_score_index(level_id_str).query(offset, limit, since)
+
+    def score_rank(self, level_id_str, username, since=None):
+        return self.get_score_index(level_id_str).rank(username, since)
+
+    def trim_editor_level(self):
+        # Trim empty rows/columns around the design; returns the level rows, or [] if nothing was placed
+        min_r, max_r, min_c, max_c = float('inf'), float('-inf'), float('inf'), float('-inf')
+        has_content = False
+        for r_idx, row in enumerate(self.editor_level_chars):
+            for c_idx, char_val in enumerate(row):
+                if char_val != ' ':
+                    has_content = True
+                    min_r = min(min_r, r_idx)
+                    max_r = max(max_r, r_idx)
+                    min_c = min(min_c, c_idx)
+                    max_c = max(max_c, c_idx)
+        if not has_content:
+            return []
+        return ["".join(self.editor_level_chars[r_idx][min_c: max_c + 1]) for r_idx in range(min_r, max_r + 1)]
+
+    def save_level(self, level_name_text, final_level_rows):
+        if not level_name_text:
+            return False, "Level name cannot be empty."
+        if not final_level_rows:
+            return False, "Cannot save an empty level design."
+
+        has_player = any('p' in r_str for r_str in final_level_rows)
+        has_box = any('b' in r_str for r_str in final_level_rows)
+        has_target = any('t' in r_str for r_str in final_level_rows)
+        if not (has_player and has_box and has_target):
+            return False, "Level needs 1 player, >=1 box, >=1 target."
+        problems = EditorAnalysis(final_level_rows).problems()
+        if problems:
+            return False, problems[0]
+
+        # Duplicates are refused once; saving the same design again right after keeps it anyway
+        fingerprint = level_fingerprint(final_level_rows)
+        duplicates = [level_id for level_id in self.level_fingerprints.get(fingerprint, []) if level_id in self.levels]
+        if duplicates and self.pending_duplicate_fingerprint != fingerprint:
+            self.pending_duplicate_fingerprint = fingerprint
+            original = self.levels[duplicates[0]]["name"]
+            return False, f"Same as level '{original}'. Click Save again to keep it anyway."
+        self.pending_duplicate_fingerprint = None
+
+        self.save_levels({
+            "name": level_name_text,
+            "data": final_level_rows,
+            "created_by": self.current_user or "System",
+            "date": datetime.now().strftime("%Y-%m-%d")
+        })
+        return True, f"Level '{level_name_text}' saved!"
+
     def setup_login_ui(self):
         self.active_input = None
         self.text_inputs = {
@@ -192,6 +2646,10 @@ class SokobanGame:
             {"rect": pygame.Rect(self.screen_width // 2 - 100, 430, 200, 40), "text": "Play as Guest",
              "action": "guest"}
         ]
+        session_user = self.session_user()
+        if session_user:
+            self.buttons.append({"rect": pygame.Rect(self.screen_width // 2 - 100, 480, 200, 35),
+                                 "text": f"Continue as {session_user}", "action": "resume_session"})
 
     def setup_menu_ui(self):
         self.active_input = None
@@ -206,9 +2664,19 @@ class SokobanGame:
         if self.user_role == ADMIN:
             self.buttons.insert(2, {"rect": pygame.Rect(self.screen_width // 2 - 100, 320, 200, 40),
                                     "text": "Level Editor", "action": "level_editor"})
+            self.buttons.insert(3, {"rect": pygame.Rect(self.screen_width // 2 - 100, 380, 200, 40),
+                                    "text": "Play Heatmaps", "action": "heatmap_level_select"})
+            self.buttons[-1]["rect"].y = 440
+        if self.current_user:
+            sharing = self.users.get(self.current_user, {}).get("telemetry")
+            self.buttons.append({"rect": pygame.Rect(self.screen_width - 220, self.screen_height - 70, 200, 40),
+                                 "text": "Share Stats: On" if sharing else "Share Stats: Off",
+                                 "action": "toggle_telemetry"})
 
-    def setup_level_selection_ui(self, page=0):  # Added pagination for many levels
+    def setup_level_selection_ui(self, page=0, action_prefix="play_level_"):  # Added pagination for many levels
         self.active_input = None
+        self.level_action_prefix = action_prefix
+        self.level_page = page
         self.text_inputs = {}
         self.buttons = [
             {"rect": pygame.Rect(50, self.screen_height - 70, 150, 40), "text": "Back to Menu", "action": "menu"}]
@@ -216,24 +2684,41 @@ class SokobanGame:
         y_pos = 100
         levels_per_page = 7
         sorted_level_ids = sorted(self.levels.keys(), key=lambda x: int(x) if x.isdigit() else float('inf'))
+        total_levels = len(sorted_level_ids) + (len(self.level_pack) if self.level_pack else 0)
 
         start_index = page * levels_per_page
         end_index = start_index + levels_per_page
 
-        for i, level_id in enumerate(sorted_level_ids[start_index:end_index]):
-            level_data = self.levels[level_id]
+        page_levels = []
+        for i, level_index in enumerate(range(start_index, min(end_index, total_levels))):
+            if level_index < len(sorted_level_ids):
+                level_id = sorted_level_ids[level_index]
+                level_name = self.levels[level_id]['name']
+                created_by = self.levels[level_id].get('created_by', 'Unknown')
+            else:  # Pack levels come after levels.json; only this page's levels are read from the pack
+                pack_number = level_index - len(sorted_level_ids)
+                level_id = f"{LEVEL_PACK_ID_PREFIX}{pack_number}"
+                level_name, created_by = self.level_pack.level_name(pack_number)
+            page_levels.append((level_id, self.get_level(level_id)["data"]))
             self.buttons.append({
                 "rect": pygame.Rect(self.screen_width // 2 - 150, y_pos + i * 50, 300, 40),
-                "text": f"{level_data['name']} (by {level_data.get('created_by', 'Unknown')})",
-                "action": f"play_level_{level_id}"
+                "text": f"{level_name} (by {created_by})",
+                "action": f"{action_prefix}{level_id}",
+                "thumbnail": level_id
             })
+        self.thumbnails.show_page(page_levels)
+        saved = self.saved_game() if action_prefix == "play_level_" else None
+        if saved:
+            level_name = self.get_level(saved[0])["name"][:14]
+            self.buttons.append({"rect": pygame.Rect(self.screen_width - 270, self.screen_height - 70, 250, 40),
+                                 "text": f"Resume {level_name} ({len(saved[1])} moves)", "action": "resume_game"})
 
         # Pagination buttons
         if page > 0:
             self.buttons.append(
                 {"rect": pygame.Rect(self.screen_width // 2 - 60, self.screen_height - 70, 50, 40), "text": "<",
                  "action": f"prev_page_{page - 1}"})
-        if end_index < len(sorted_level_ids):
+        if end_index < total_levels:
             self.buttons.append(
                 {"rect": pygame.Rect(self.screen_width // 2 + 10, self.screen_height - 70, 50, 40), "text": ">",
                  "action": f"next_page_{page + 1}"})
@@ -249,12 +2734,20 @@ class SokobanGame:
         if self.current_state != "game_over_leaderboard":  # if not coming from game over screen
             self.buttons[0]["text"] = "Back to Menu"
             self.buttons[0]["action"] = "menu"
+        self.buttons += [
+            {"rect": pygame.Rect(self.screen_width - 250, self.screen_height - 70, 100, 40), "text": "My Rank",
+             "action": "leaderboard_my_rank"},
+            {"rect": pygame.Rect(self.screen_width - 140, self.screen_height - 70, 120, 40), "text": "This Week",
+             "action": "leaderboard_toggle_week"},
+        ]
+        self.leaderboard_view = LeaderboardView(self, str(level_id_to_show))
 
     def setup_level_editor_ui(self):
         self.active_input = None
         self.editor_level_chars = [[' ' for _ in range(EDITOR_GRID_COLS)] for _ in
                                    range(EDITOR_GRID_ROWS)]  # Reset grid
         self.editor_player_pos_rc = None
+        self.editor_analysis = EditorAnalysis(self.editor_level_chars)
         self.text_inputs = {
             "level_name": {
                 "rect": pygame.Rect(EDITOR_OFFSET_X + EDITOR_GRID_COLS * TILE_SIZE + 20, EDITOR_OFFSET_Y, 200, 40),
@@ -326,12 +2819,34 @@ class SokobanGame:
         elif self.ui_message_timer <= 0:
             self.ui_message = ""
 
+    def draw_global_leaderboard(self):
+        # Rendered text is cached until the ranking or the logged-in user changes
+        cache_key = (self.global_leaderboard.version, self.current_user)
+        if self.global_leaderboard_cache is None or self.global_leaderboard_cache[0] != cache_key:
+            lines = ["Top Players (all levels)"]
+            for rank, username, (levels_solved, total_moves, points) in self.global_leaderboard.top(
+                    GLOBAL_LEADERBOARD_ROWS):
+                lines.append(f"{rank}. {username}  {points}p  {levels_solved}lv  {total_moves}mv")
+            if not self.global_leaderboard.ranking:
+                lines.append("No scores yet.")
+            if self.current_user:
+                my_rank = self.global_leaderboard.rank_of(self.current_user)
+                lines.append(f"Your rank: {my_rank} of {len(self.global_leaderboard.ranking)}" if my_rank
+                             else "Your rank: unranked")
+            self.global_leaderboard_cache = (cache_key, [self.small_font.render(line, True, TEXT_COLOR)
+                                                         for line in lines])
+
+        x, y = self.screen_width - 260, 200
+        for i, line_surface in enumerate(self.global_leaderboard_cache[1]):
+            self.screen.blit(line_surface, (x, y + i * 25))
+
     def draw_login(self):
         self.screen.fill(FLOOR_COLOR)
         title = self.font.render("Sokoban Game", True, TEXT_COLOR)
         self.screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, 100))
         self.draw_text_inputs()
         self.draw_buttons()
+        self.draw_global_leaderboard()
         self.draw_ui_message()
 
     def draw_menu(self):
@@ -343,48 +2858,98 @@ class SokobanGame:
         welcome_text_surface = self.font.render(welcome_msg, True, TEXT_COLOR)
         self.screen.blit(welcome_text_surface, (self.screen_width // 2 - welcome_text_surface.get_width() // 2, 100))
         self.draw_buttons()
+        self.draw_global_leaderboard()
         self.draw_ui_message()
 
     def draw_level_selection(self):
         self.screen.fill(FLOOR_COLOR)
-        title = self.font.render("Select a Level", True, TEXT_COLOR)
+        title_text = {"play_level_": "Select a Level", "show_leaderboard_": "Select Level for Leaderboard"}.get(
+            self.level_action_prefix, "Select a Level to Inspect")
+        title = self.font.render(title_text, True, TEXT_COLOR)
         self.screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, 50))
         self.draw_buttons()
+        self.thumbnails.poll()
+        for button in self.buttons:
+            if "thumbnail" not in button:
+                continue
+            thumb_rect = pygame.Rect(button["rect"].x - THUMBNAIL_WIDTH - 10, button["rect"].y, THUMBNAIL_WIDTH,
+                                     THUMBNAIL_HEIGHT)
+            thumbnail = self.thumbnails.get(button["thumbnail"])
+            if thumbnail:
+                self.screen.blit(thumbnail, thumb_rect)
+            pygame.draw.rect(self.screen, EDITOR_GRID_COLOR, thumb_rect, 1)  # Frame, or placeholder while loading
+        self.draw_ui_message()
+
+    def setup_heatmap_ui(self, level_id, mode="visits"):
+        self.active_input = None
+        self.text_inputs = {}
+        level_rows = self.get_level(level_id)["data"]
+        self.heatmap = (level_id, self.telemetry.totals(level_id, len(level_rows), max(map(len, level_rows))), mode)
+        self.buttons = [
+            {"rect": pygame.Rect(50, self.screen_height - 70, 200, 40), "text": "Back to Level Select",
+             "action": "heatmap_level_select"},
+            {"rect": pygame.Rect(self.screen_width - 250, self.screen_height - 70, 200, 40),
+             "text": "Show Pushes" if mode == "visits" else "Show Visits", "action": "heatmap_toggle_mode"},
+        ]
+
+    def draw_heatmap(self):
+        self.screen.fill(FLOOR_COLOR)
+        level_id, totals, mode = self.heatmap
+        level_data = self.get_level(level_id)
+        title = self.font.render(f"Heatmap ({mode}): {level_data['name']}", True, TEXT_COLOR)
+        self.screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, 20))
+
+        offset_x = (self.screen_width - totals.cols * TILE_SIZE) // 2
+        offset_y = max(90, (self.screen_height - totals.rows * TILE_SIZE) // 2)
+        tile_names = {'#': "wall", 't': "target", 'b': "box", '*': "box_on_target", 'p': "player",
+                      '+': "player_on_target"}
+        self.tile_atlas.draw_board(self.screen, TILE_SIZE, [(r, c, tile_names[char])
+                                                            for r, row in enumerate(level_data["data"])
+                                                            for c, char in enumerate(row) if char in tile_names],
+                                   offset_x, offset_y)
+        counts = totals.visits if mode == "visits" else totals.pushes
+        peak = max(counts, default=0)
+        if peak:
+            overlay = pygame.Surface((TILE_SIZE, TILE_SIZE), pygame.SRCALPHA)
+            for i, count in enumerate(counts):
+                if count:
+                    overlay.fill(HEATMAP_COLOR + (HEATMAP_MAX_ALPHA * count // peak,))
+                    r, c = divmod(i, totals.cols)
+                    self.screen.blit(overlay, (offset_x + c * TILE_SIZE, offset_y + r * TILE_SIZE))
+
+        plays, solves = totals.counts["plays"], totals.counts["solves"]
+        summary = f"Plays: {plays}  Solved: {solves}  Restarts: {totals.counts['restarts']}  " \
+                  f"Abandoned: {totals.counts['abandons']}"
+        if solves:
+            summary += f"  Avg solve: {totals.counts['solve_seconds'] / solves:.0f}s"
+        summary_surface = self.small_font.render(summary if plays else "No play data yet.", True, TEXT_COLOR)
+        self.screen.blit(summary_surface, (self.screen_width // 2 - summary_surface.get_width() // 2, 55))
+        self.draw_buttons()
         self.draw_ui_message()
 
     def draw_leaderboard_display(self):  # Renamed from draw_leaderboard
         self.screen.fill(FLOOR_COLOR)
-        title_text = "Leaderboard"
-        if self.current_level_id_playing is not None and str(self.current_level_id_playing) in self.levels:
-            level_name = self.levels[str(self.current_level_id_playing)]["name"]
-            title_text = f"Leaderboard: {level_name}"
+        level_id_str = str(self.current_level_id_playing)
+        if self.leaderboard_view is None or self.leaderboard_view.level_id != level_id_str:
+            self.leaderboard_view = LeaderboardView(self, level_id_str)
 
+        title_text = "Leaderboard"
+        if self.current_level_id_playing is not None and self.leaderboard_view.level:
+            title_text = f"Leaderboard: {self.leaderboard_view.level['name']}"
         title_surface = self.font.render(title_text, True, TEXT_COLOR)
         self.screen.blit(title_surface, (self.screen_width // 2 - title_surface.get_width() // 2, 30))
-
-        level_id_str = str(self.current_level_id_playing)
-        if level_id_str not in self.scores or not self.scores[level_id_str]:
-            no_scores_surface = self.font.render("No scores yet for this level.", True, TEXT_COLOR)
+        if self.leaderboard_view.total == 0:
+            empty_text = "No scores this week." if self.leaderboard_view.since else "No scores yet for this level."
+            no_scores_surface = self.font.render(empty_text, True, TEXT_COLOR)
             self.screen.blit(no_scores_surface, (self.screen_width // 2 - no_scores_surface.get_width() // 2, 200))
         else:
             headers = ["Rank", "Username", "Moves", "Date"]
-            col_widths = [80, 200, 100, 200]
-            start_x = (self.screen_width - sum(col_widths)) // 2
+            start_x = (self.screen_width - sum(LEADERBOARD_COL_WIDTHS)) // 2
 
             for i, header in enumerate(headers):
                 header_surface = self.small_font.render(header, True, TEXT_COLOR)
-                self.screen.blit(header_surface, (start_x + sum(col_widths[:i]) + 10, 80))
-
-            for i, score_entry in enumerate(self.scores[level_id_str][:15]):  # Show top 15
-                texts_to_render = [
-                    str(i + 1),
-                    score_entry["username"],
-                    str(score_entry["moves"]),
-                    score_entry["date"]
-                ]
-                for col_idx, text_val in enumerate(texts_to_render):
-                    score_surface = self.small_font.render(text_val, True, TEXT_COLOR)
-                    self.screen.blit(score_surface, (start_x + sum(col_widths[:col_idx]) + 10, 110 + i * 25))
+                self.screen.blit(header_surface, (start_x + sum(LEADERBOARD_COL_WIDTHS[:i]) + 10, 80))
+            self.leaderboard_view.draw(self.screen)
         self.draw_buttons()
         self.draw_ui_message()
 
@@ -408,27 +2973,48 @@ class SokobanGame:
         current_tool_text = self.small_font.render(f"Active Tool: {tool_names[self.editor_tool]}", True, PLAYER_COLOR)
         self.screen.blit(current_tool_text, (EDITOR_OFFSET_X, EDITOR_OFFSET_Y - 70))
 
-        for r in range(EDITOR_GRID_ROWS):
-            for c in range(EDITOR_GRID_COLS):
-                rect = pygame.Rect(EDITOR_OFFSET_X + c * TILE_SIZE, EDITOR_OFFSET_Y + r * TILE_SIZE, TILE_SIZE,
-                                   TILE_SIZE)
-                pygame.draw.rect(self.screen, EDITOR_GRID_COLOR, rect, 1)  # Grid line
+        if self.editor_grid_surface is None:
+            self.editor_grid_surface = pygame.Surface((EDITOR_GRID_COLS * TILE_SIZE, EDITOR_GRID_ROWS * TILE_SIZE))
+            self.editor_grid_surface.fill(FLOOR_COLOR)
+            for r in range(EDITOR_GRID_ROWS):
+                for c in range(EDITOR_GRID_COLS):
+                    pygame.draw.rect(self.editor_grid_surface, EDITOR_GRID_COLOR,
+                                     (c * TILE_SIZE, r * TILE_SIZE, TILE_SIZE, TILE_SIZE), 1)  # Grid line
+            self.editor_grid_surface = self.tile_atlas.convert_surface(self.editor_grid_surface)
+        self.screen.blit(self.editor_grid_surface, (EDITOR_OFFSET_X, EDITOR_OFFSET_Y))
 
-                char = self.editor_level_chars[r][c]
-                char_rect = rect.inflate(-2, -2)  # Slightly smaller rect for drawing char
-                if char == '#':
-                    pygame.draw.rect(self.screen, WALL_COLOR, char_rect)
-                elif char == 'b':
-                    pygame.draw.rect(self.screen, BOX_COLOR, char_rect)
-                elif char == 't':
-                    pygame.draw.rect(self.screen, TARGET_COLOR, char_rect)  # Solid target for editor
-                elif char == 'p':
-                    pygame.draw.rect(self.screen, PLAYER_COLOR, char_rect)
+        # Tiles are drawn slightly smaller than the cell so the grid lines stay visible
+        editor_tiles = {'#': "wall", 'b': "box", 't': "target", 'p': "player"}
+        cells = [(r, c, editor_tiles[char]) for r, row in enumerate(self.editor_level_chars)
+                 for c, char in enumerate(row) if char in editor_tiles]
+        self.tile_atlas.draw_board(self.screen, TILE_SIZE - 2, cells, EDITOR_OFFSET_X + 1, EDITOR_OFFSET_Y + 1, TILE_SIZE)
+        self.draw_editor_analysis()
 
         self.draw_text_inputs()  # For level name
         self.draw_buttons()  # For save, back, tools
         self.draw_ui_message()
 
+    def draw_editor_analysis(self):
+        # All clicks since the last frame are analysed together, so dragging stays cheap
+        analysis = self.editor_analysis
+        analysis.refresh()
+        if self.editor_overlay_cache is None or self.editor_overlay_cache[0] != analysis.version:
+            overlay = pygame.Surface((EDITOR_GRID_COLS * TILE_SIZE, EDITOR_GRID_ROWS * TILE_SIZE), pygame.SRCALPHA)
+            for r, c in analysis.reachable:
+                overlay.fill(EDITOR_REACHABLE_COLOR, (c * TILE_SIZE + 1, r * TILE_SIZE + 1, TILE_SIZE - 2, TILE_SIZE - 2))
+            for r, c in analysis.dead_squares:
+                overlay.fill(EDITOR_DEAD_COLOR, (c * TILE_SIZE + 1, r * TILE_SIZE + 1, TILE_SIZE - 2, TILE_SIZE - 2))
+            for r, c in analysis.frozen_boxes - analysis.targets | analysis.unreachable_targets():
+                pygame.draw.rect(overlay, MESSAGE_COLOR, (c * TILE_SIZE, r * TILE_SIZE, TILE_SIZE, TILE_SIZE), 3)
+            status_surfaces = [self.small_font.render(line, True, MESSAGE_COLOR if i > 1 else TEXT_COLOR)
+                               for i, line in enumerate(analysis.status_lines())]
+            self.editor_overlay_cache = (analysis.version, overlay, status_surfaces)
+
+        self.screen.blit(self.editor_overlay_cache[1], (EDITOR_OFFSET_X, EDITOR_OFFSET_Y))
+        status_x = EDITOR_OFFSET_X + EDITOR_GRID_COLS * TILE_SIZE + 20
+        for i, line_surface in enumerate(self.editor_overlay_cache[2]):
+            self.screen.blit(line_surface, (status_x, EDITOR_OFFSET_Y + 160 + i * 22))
+
     def handle_editor_click(self, pos, button):
         grid_c = (pos[0] - EDITOR_OFFSET_X) // TILE_SIZE
         grid_r = (pos[1] - EDITOR_OFFSET_Y) // TILE_SIZE
@@ -449,6 +3035,7 @@ class SokobanGame:
             elif button == 3:  # Right click - always erase
                 tool_char = ' '
 
+            old_player_rc = self.editor_player_pos_rc
             # If placing player, remove old player first
             if tool_char == 'p':
                 if self.editor_player_pos_rc:
@@ -464,7 +3051,13 @@ class SokobanGame:
             if self.editor_player_pos_rc == (grid_r, grid_c) and tool_char != 'p':
                 self.editor_player_pos_rc = None  # Remove player if overwriting its spot with non-player
 
+            if old_player_rc and old_player_rc != self.editor_player_pos_rc:
+                self.editor_analysis.cell_changed(old_player_rc[0], old_player_rc[1], 'p',
+                                                  self.editor_level_chars[old_player_rc[0]][old_player_rc[1]])
+            old_char = self.editor_level_chars[grid_r][grid_c]
             self.editor_level_chars[grid_r][grid_c] = tool_char
+            if old_char != tool_char:
+                self.editor_analysis.cell_changed(grid_r, grid_c, old_char, tool_char)
 
     def handle_button_click(self, pos):
         for button_data in self.buttons:
@@ -484,9 +3077,14 @@ class SokobanGame:
         return clicked_input_name
 
     def run(self):
+        if self.diagnostics:
+            self.diagnostics.start(self)
         running = True
         while running:
             mouse_clicked_this_frame = False
+            self.poll_data_files()
+            self.merge_read_scores()
+            self.poll_password_task()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
@@ -498,27 +3096,19 @@ class SokobanGame:
                         # Handle tool selection buttons in editor
                         if action.startswith("tool_"):
                             self.editor_tool = int(action.split("_")[1])
-                        elif action == "login":
-                            if "username" in self.text_inputs and "password" in self.text_inputs:
-                                success, message = self.login_user(
-                                    self.text_inputs["username"]["text"],
-                                    self.text_inputs["password"]["text"]
-                                )
-                                self.set_ui_message(message)
-                                if success:
-                                    self.setup_menu_ui()
-                                    self.current_state = "menu"
-                        elif action == "register":
+                        elif action in ("login", "register"):
                             if "username" in self.text_inputs and "password" in self.text_inputs:
-                                success, message = self.register_user(
-                                    self.text_inputs["username"]["text"],
-                                    self.text_inputs["password"]["text"]
-                                )
-                                self.set_ui_message(message)
-                                # Clear fields on success
-                                if success:
-                                    self.text_inputs["username"]["text"] = ""
-                                    self.text_inputs["password"]["text"] = ""
+                                # Hashing is slow on purpose, so it runs in a PasswordTask; see poll_password_task
+                                self.start_password_task(action, self.text_inputs["username"]["text"],
+                                                         self.text_inputs["password"]["text"])
+                        elif action == "resume_session":
+                            success, message = self.resume_session()
+                            self.set_ui_message(message)
+                            if success:
+                                self.setup_menu_ui()
+                                self.current_state = "menu"
+                            else:
+                                self.setup_login_ui()
                         elif action == "guest":
                             self.current_user = None
                             self.user_role = ANONYMOUS
@@ -528,19 +3118,48 @@ class SokobanGame:
                         elif action == "level_selection":
                             self.setup_level_selection_ui()
                             self.current_state = "level_selection"
+                        elif action == "toggle_telemetry":
+                            self.toggle_telemetry()
+                        elif action == "heatmap_level_select":
+                            self.setup_level_selection_ui(action_prefix="heatmap_level_")
+                            self.current_state = "level_selection"
+                        elif action.startswith("heatmap_level_"):
+                            self.setup_heatmap_ui(action[len("heatmap_level_"):])
+                            self.current_state = "heatmap"
+                        elif action == "heatmap_toggle_mode":
+                            other_mode = "pushes" if self.heatmap[2] == "visits" else "visits"
+                            self.setup_heatmap_ui(self.heatmap[0], other_mode)
+                        elif action == "resume_game":
+                            if self.resume_game():
+                                self.buttons = []
+                                self.current_state = "game"
                         elif action.startswith("play_level_"):
                             level_id = action.split("_")[-1]
                             self.current_level_id_playing = level_id
                             self.game_instance = SokobanLevel(self, level_id)
+                            self.buttons = []  # The board takes mouse input now, not the level buttons
                             self.current_state = "game"
                         elif action == "leaderboard_entry":  # New action to go to level selection for leaderboard
                             self.set_ui_message("Select a level to view its leaderboard.")
-                            self.setup_level_selection_ui()  # Show levels, then they pick one for its leaderboard
-                            self.current_state = "leaderboard_level_select"  # New state
+                            # Same paged list as level selection (pack levels included), with a different action
+                            self.setup_level_selection_ui(action_prefix="show_leaderboard_")
+                            self.current_state = "leaderboard_level_select"
+                        elif action.startswith("show_leaderboard_"):
+                            self.setup_leaderboard_display_ui(action[len("show_leaderboard_"):])
+                            self.current_state = "leaderboard_display"
                         elif action == "leaderboard_back_to_level_select":
                             self.setup_level_selection_ui()
                             self.current_state = "level_selection"
+                        elif action == "leaderboard_my_rank" and self.leaderboard_view:
+                            if not self.leaderboard_view.jump_to_user(self.current_user):
+                                self.set_ui_message("You have no score here yet.", 120)
+                        elif action == "leaderboard_toggle_week" and self.leaderboard_view:
+                            self.leaderboard_view.toggle_week()
+                            for button_data in self.buttons:
+                                if button_data["action"] == "leaderboard_toggle_week":
+                                    button_data["text"] = "All Time" if self.leaderboard_view.since else "This Week"
                         elif action == "logout":
+                            self.end_session(self.current_user)
                             self.current_user = None
                             self.user_role = ANONYMOUS
                             self.set_ui_message("Logged out.")
@@ -554,53 +3173,19 @@ class SokobanGame:
                             self.current_state = "level_editor"
                         elif action == "save_level":
                             level_name_text = self.text_inputs.get("level_name", {}).get("text", "").strip()
-                            if not level_name_text:
-                                self.set_ui_message("Level name cannot be empty.", 120)
-                            else:
-                                # Trim and validate level
-                                min_r, max_r, min_c, max_c = float('inf'), float('-inf'), float('inf'), float('-inf')
-                                has_content = False
-                                for r_idx, row in enumerate(self.editor_level_chars):
-                                    for c_idx, char_val in enumerate(row):
-                                        if char_val != ' ':
-                                            has_content = True
-                                            min_r = min(min_r, r_idx)
-                                            max_r = max(max_r, r_idx)
-                                            min_c = min(min_c, c_idx)
-                                            max_c = max(max_c, c_idx)
-
-                                if not has_content:
-                                    self.set_ui_message("Cannot save an empty level design.", 120)
-                                else:
-                                    final_level_rows = []
-                                    for r_idx in range(min_r, max_r + 1):
-                                        final_level_rows.append(
-                                            "".join(self.editor_level_chars[r_idx][min_c: max_c + 1]))
-
-                                    has_player = any('p' in r_str for r_str in final_level_rows)
-                                    has_box = any('b' in r_str for r_str in final_level_rows)
-                                    has_target = any('t' in r_str for r_str in final_level_rows)
-
-                                    if not (has_player and has_box and has_target):
-                                        self.set_ui_message("Level needs 1 player, >=1 box, >=1 target.", 180)
-                                    else:
-                                        new_level_id = str(
-                                            max([int(k) for k in self.levels.keys() if k.isdigit()] + [-1]) + 1)
-                                        self.levels[new_level_id] = {
-                                            "name": level_name_text,
-                                            "data": final_level_rows,
-                                            "created_by": self.current_user or "System",
-                                            "date": datetime.now().strftime("%Y-%m-%d")
-                                        }
-                                        self.save_levels()
-                                        self.set_ui_message(f"Level '{level_name_text}' saved!", 120)
-                                        self.text_inputs["level_name"]["text"] = ""  # Clear name field
+                            success, message = self.save_level(level_name_text, self.trim_editor_level())
+                            self.set_ui_message(message, 180 if not success else 120)
+                            if success:
+                                self.text_inputs["level_name"]["text"] = ""  # Clear name field
                         elif action.startswith("prev_page_") or action.startswith("next_page_"):
                             page = int(action.split("_")[-1])
-                            self.setup_level_selection_ui(page=page)
+                            self.setup_level_selection_ui(page=page, action_prefix=self.level_action_prefix)
                     else:  # No button was clicked, check for text input click
                         self.handle_text_input_click(event.pos)
 
+                    if self.current_state == "game" and self.game_instance and not action:
+                        self.game_instance.handle_mouse_down(event.pos, event.button)
+
                     # If in level editor and not clicking a button, handle grid click
                     if self.current_state == "level_editor" and not action:
                         # Check if click is within editor grid bounds
@@ -608,7 +3193,18 @@ class SokobanGame:
                                 EDITOR_OFFSET_Y <= event.pos[1] < EDITOR_OFFSET_Y + EDITOR_GRID_ROWS * TILE_SIZE:
                             self.handle_editor_click(event.pos, event.button)
 
+                if event.type == pygame.MOUSEWHEEL and self.leaderboard_view and \
+                        self.current_state in ("leaderboard_display", "game_over_leaderboard"):
+                    self.leaderboard_view.scroll_by(-event.y * LEADERBOARD_ROW_HEIGHT * 3)
+
+                if event.type == pygame.MOUSEBUTTONUP:
+                    if self.current_state == "game" and self.game_instance:
+                        self.game_instance.handle_mouse_up(event.pos, event.button)
+
                 if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_F3 and self.diagnostics:
+                        self.diagnostics.overlay_visible = not self.diagnostics.overlay_visible
+                        self.diagnostics.report_requested.set()
                     if self.active_input is not None and self.active_input in self.text_inputs:
                         if event.key == pygame.K_RETURN:
                             # Potentially trigger login/register or just deactivate
@@ -626,21 +3222,42 @@ class SokobanGame:
                             self.text_inputs[self.active_input]["text"] += event.unicode
 
                     if self.current_state == "game" and self.game_instance:
+                        if event.key in (pygame.K_UP, pygame.K_DOWN, pygame.K_LEFT, pygame.K_RIGHT):
+                            self.game_instance.cancel_auto_moves()  # Keyboard input takes over from mouse paths
                         if event.key == pygame.K_UP:
-                            self.game_instance.move_player(0, -1)
+                            self.game_instance.move_player(-1, 0)
                         elif event.key == pygame.K_DOWN:
-                            self.game_instance.move_player(0, 1)
+                            self.game_instance.move_player(1, 0)
                         elif event.key == pygame.K_LEFT:
-                            self.game_instance.move_player(-1, 0)
+                            self.game_instance.move_player(0, -1)
                         elif event.key == pygame.K_RIGHT:
-                            self.game_instance.move_player(1, 0)
+                            self.game_instance.move_player(0, 1)
+                        elif event.key == pygame.K_h:
+                            self.game_instance.request_hint()
+                        elif event.key == pygame.K_u:
+                            self.game_instance.cancel_auto_moves()
+                            self.game_instance.undo()
                         elif event.key == pygame.K_r:
+                            self.game_instance.end_attempt("restarts")
+                            self.game_instance.cancel_hint()
+                            self.autosave_game(finished=True)
                             self.game_instance = SokobanLevel(self, self.current_level_id_playing)  # Reset
                             self.set_ui_message("Level Reset.", 60)
                         elif event.key == pygame.K_ESCAPE:
+                            self.game_instance.end_attempt("abandons")
+                            self.game_instance.cancel_hint()
+                            self.autosave_game(force=True)  # Kept resumable from the level selection screen
                             self.set_ui_message("")  # Clear game messages
                             self.setup_level_selection_ui()  # Go back to level selection
                             self.current_state = "level_selection"
+                    elif self.current_state in ("leaderboard_display", "game_over_leaderboard") and \
+                            self.leaderboard_view:
+                        page_px = self.leaderboard_view.viewport.height - LEADERBOARD_ROW_HEIGHT
+                        scroll_keys = {pygame.K_UP: -LEADERBOARD_ROW_HEIGHT, pygame.K_DOWN: LEADERBOARD_ROW_HEIGHT,
+                                       pygame.K_PAGEUP: -page_px, pygame.K_PAGEDOWN: page_px,
+                                       pygame.K_HOME: -float('inf'), pygame.K_END: float('inf')}
+                        if event.key in scroll_keys:
+                            self.leaderboard_view.scroll_by(scroll_keys[event.key])
                     elif self.current_state == "level_editor":
                         if pygame.K_0 <= event.key <= pygame.K_4:
                             self.editor_tool = event.key - pygame.K_0
@@ -667,59 +3284,20 @@ class SokobanGame:
                 self.draw_menu()
             elif self.current_state == "level_selection":
                 self.draw_level_selection()
-            elif self.current_state == "leaderboard_level_select":  # New state drawing
-                self.screen.fill(FLOOR_COLOR)
-                title = self.font.render("Select Level for Leaderboard", True, TEXT_COLOR)
-                self.screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, 50))
-                # Re-use level selection buttons, but action will be different
-                temp_buttons_for_leaderboard_select = []
-                y_pos = 100
-                for lvl_id, lvl_data in self.levels.items():
-                    btn_rect = pygame.Rect(self.screen_width // 2 - 150, y_pos, 300, 40)
-                    temp_buttons_for_leaderboard_select.append({
-                        "rect": btn_rect,
-                        "text": lvl_data["name"],
-                        "action": f"show_leaderboard_{lvl_id}"  # Specific action
-                    })
-                    # Draw them immediately for this special state
-                    color = BUTTON_HOVER_COLOR if btn_rect.collidepoint(pygame.mouse.get_pos()) else BUTTON_COLOR
-                    pygame.draw.rect(self.screen, color, btn_rect)
-                    pygame.draw.rect(self.screen, (0, 0, 0), btn_rect, 2)
-                    text_surf = self.small_font.render(lvl_data["name"], True, TEXT_COLOR)
-                    self.screen.blit(text_surf, text_surf.get_rect(center=btn_rect.center))
-                    y_pos += 50
-                    if y_pos > self.screen_height - 100: break  # Limit display
-
-                # Handle clicks for these temporary buttons
-                if mouse_clicked_this_frame:
-                    for btn_data in temp_buttons_for_leaderboard_select:
-                        if btn_data["rect"].collidepoint(pygame.mouse.get_pos()):
-                            action = btn_data["action"]
-                            if action.startswith("show_leaderboard_"):
-                                level_id_to_show = action.split("_")[-1]
-                                self.setup_leaderboard_display_ui(level_id_to_show)
-                                self.current_state = "leaderboard_display"
-                                break
-                # Back button for this state
-                back_btn_data = {"rect": pygame.Rect(50, self.screen_height - 70, 150, 40), "text": "Back to Menu",
-                                 "action": "menu"}
-                color = BUTTON_HOVER_COLOR if back_btn_data["rect"].collidepoint(
-                    pygame.mouse.get_pos()) else BUTTON_COLOR
-                pygame.draw.rect(self.screen, color, back_btn_data["rect"])
-                pygame.draw.rect(self.screen, (0, 0, 0), back_btn_data["rect"], 2)
-                text_surf = self.small_font.render(back_btn_data["text"], True, TEXT_COLOR)
-                self.screen.blit(text_surf, text_surf.get_rect(center=back_btn_data["rect"].center))
-                if mouse_clicked_this_frame and back_btn_data["rect"].collidepoint(pygame.mouse.get_pos()):
-                    self.setup_menu_ui()
-                    self.current_state = "menu"
+            elif self.current_state == "leaderboard_level_select":
+                self.draw_level_selection()
 
                 self.draw_ui_message()
 
             elif self.current_state == "leaderboard_display":
                 self.draw_leaderboard_display()
+            elif self.current_state == "heatmap":
+                self.draw_heatmap()
             elif self.current_state == "level_editor":
                 self.draw_level_editor()
             elif self.current_state == "game" and self.game_instance:
+                self.game_instance.update()  # Plays out queued mouse moves
+                self.autosave_game()
                 self.game_instance.draw()
                 self.draw_ui_message()  # Show game-related messages like win/reset
             elif self.current_state == "game_over_leaderboard":  # After winning, show leaderboard for that level
@@ -736,9 +3314,21 @@ class SokobanGame:
                     self.setup_level_selection_ui()
                     self.current_state = "level_selection"
 
+            if self.diagnostics:
+                self.diagnostics.update(self)
+                self.diagnostics.draw(self)
             pygame.display.flip()
+            if pygame.time.get_ticks() >= self.telemetry.next_flush_ticks:
+                self.telemetry.flush()
             self.clock.tick(60)
 
+        if self.current_state == "game" and self.game_instance:
+            self.game_instance.end_attempt("abandons")
+            self.autosave_game(force=True)
+        self.autosave_writer.wait()
+        self.score_sync.wait()
+        self.telemetry.flush()
+        self.telemetry.wait()
         pygame.quit()
         sys.exit()
 
@@ -747,8 +3337,11 @@ class SokobanLevel:
     def __init__(self, game_manager, level_id_str):
         self.game_manager = game_manager
         self.level_id = level_id_str  # Keep as string to match keys
+        if game_manager.diagnostics:
+            game_manager.diagnostics.track_level(self)
 
-        if self.level_id not in game_manager.levels:
+        level_data = game_manager.get_level(self.level_id)
+        if level_data is None:
             print(f"Error: Level ID {self.level_id} not found.")
             # Fallback or error handling
             self.game_manager.set_ui_message(f"Error: Level {self.level_id} not found.", 180)
@@ -759,7 +3352,7 @@ class SokobanLevel:
             self.level = self.level_data["data"]
             self.valid_level = False
         else:
-            self.level_data = game_manager.levels[self.level_id]
+            self.level_data = level_data
             self.level = self.level_data["data"]  # List of strings
             self.valid_level = True
 
@@ -767,15 +3360,36 @@ class SokobanLevel:
         self.boxes_rc = []  # List of (row, col)
         self.targets_rc = []  # List of (row, col)
         self.walls_rc = []  # List of (row, col)
+        self.walls_set = set()  # Same cells as walls_rc, for O(1) lookups
 
         if self.valid_level:
             self.parse_level()
 
+        # Mouse play: cached player reachability, shortest-path tree and queued moves
+        self.reachable = None  # Cells the player can walk to without pushing; None means recompute on demand
+        self.state_version = 0  # Bumped on every push
+        self.path_tree_key = None
+        self.path_tree = {}  # cell -> (previous cell, (d_row, d_col)) for walks from the player position
+        self.move_queue = deque()
+        self.last_auto_move_ticks = 0
+        self.drag_box = None  # Box cell picked up with the mouse
+
+        # Hints are computed by the game's HintWorker thread and polled in update()
+        self.hint_request = None  # (request id, state it was asked for)
+        self.hint = None  # (box cell, (d_row, d_col)) currently highlighted
+        self.hint_timer = 0
+
         self.moves = 0
+        self.move_log = []  # (direction index, pushed) per move, encoded with encode_run when the level is won
+        self.start_ticks = None  # Time of the first move
+        self.autosave_started = False  # Whether this game's log has been started in the user's autosave file
+        self.autosave_synced = 0  # Leading entries of move_log already in the autosave log
+        self.autosave_undos = 0  # Saved moves undone since the last autosave
+        self.setup_ghost()
         self.screen = game_manager.screen
         self.font = game_manager.font
         self.small_font = game_manager.small_font  # For moves text
-        self.use_images = False  # Defaulting to no images as per prior requests
+        self.tile_atlas = game_manager.tile_atlas  # Shared, so resets don't reload or rescale any tiles
 
         # Calculate level dimensions for drawing
         if self.level and self.level[0]:
@@ -791,6 +3405,44 @@ class SokobanLevel:
         self.offset_y = (self.screen.get_height() - self.level_pixel_height) // 2
         if self.offset_y < 60: self.offset_y = 60  # Ensure space for top text
 
+        # Opt-in play statistics; tiles are indexed row * telemetry_cols + col
+        self.telemetry_cols = max(map(len, self.level))
+        self.telemetry = game_manager.level_telemetry(self.level_id, len(self.level), self.telemetry_cols) \
+            if self.valid_level else None
+        self.attempt_over = False
+
+    def setup_ghost(self):
+        # Race the best recorded run on this level, replayed as a translucent ghost
+        self.ghost_steps = None  # Iterator over the decoded run, advanced one step per GHOST_STEP_MS
+        self.ghost_player = None
+        self.ghost_boxes = set()
+        self.ghost_label = ""
+        self.ghost_next_ticks = None  # Ghost starts with the player's first move
+        best = next((entry for entry in self.game_manager.scores.get(self.level_id, []) if entry.get("run")), None)
+        if best and self.valid_level:
+            self.ghost_steps = iter_run(best["run"])
+            self.ghost_player = self.player_pos_rc
+            self.ghost_boxes = set(self.boxes_rc)
+            self.ghost_label = f"Ghost: {best['username']} ({best['moves']} moves)"
+
+    def advance_ghost(self):
+        now = pygame.time.get_ticks()
+        while self.ghost_steps and self.ghost_next_ticks is not None and now >= self.ghost_next_ticks:
+            self.ghost_next_ticks += GHOST_STEP_MS
+            step = next(self.ghost_steps, None)
+            if step is None:
+                self.ghost_steps = None  # Run finished, the ghost stays on its final position
+                break
+            dr, dc = DIRECTIONS[step[0]]
+            next_cell = (self.ghost_player[0] + dr, self.ghost_player[1] + dc)
+            if step[1]:
+                if next_cell not in self.ghost_boxes:
+                    self.ghost_steps = None  # Run doesn't match this level (it was edited), stop replaying
+                    break
+                self.ghost_boxes.remove(next_cell)
+                self.ghost_boxes.add((next_cell[0] + dr, next_cell[1] + dc))
+            self.ghost_player = next_cell
+
     def parse_level(self):
         self.boxes_rc = []
         self.targets_rc = []
@@ -798,17 +3450,19 @@ class SokobanLevel:
         player_found = False
         for r, row_str in enumerate(self.level):
             for c, char in enumerate(row_str):
-                if char == 'p':
+                # '+' (player on target) and '*' (box on target) come from imported XSB levels
+                if char in 'p+':
                     if player_found:
                         print("Warning: Multiple players in level data, using first one.")
                     else:
                         self.player_pos_rc = (r, c); player_found = True
-                elif char == 'b':
+                elif char in 'b*':
                     self.boxes_rc.append((r, c))
-                elif char == 't':
+                if char in 't+*':
                     self.targets_rc.append((r, c))
-                elif char == '#':
+                if char == '#':
                     self.walls_rc.append((r, c))
+        self.walls_set = set(self.walls_rc)
         if not player_found:
             print(f"Error: No player 'p' in level {self.level_id}. Placing at (0,0) as fallback.")
             self.player_pos_rc = (0, 0)  # Fallback
@@ -819,37 +3473,53 @@ class SokobanLevel:
 
         self.screen.fill(FLOOR_COLOR)
 
-        # Draw elements relative to offset
-        for r, c in self.targets_rc:
-            pygame.draw.rect(self.screen, TARGET_COLOR,
-                             (self.offset_x + c * TILE_SIZE, self.offset_y + r * TILE_SIZE, TILE_SIZE, TILE_SIZE))
-        for r, c in self.walls_rc:
-            pygame.draw.rect(self.screen, WALL_COLOR,
-                             (self.offset_x + c * TILE_SIZE, self.offset_y + r * TILE_SIZE, TILE_SIZE, TILE_SIZE))
-
-        for r_box, c_box in self.boxes_rc:
-            color = TARGET_BOX_COLOR if (r_box, c_box) in self.targets_rc else BOX_COLOR
-            pygame.draw.rect(self.screen, color, (
-            self.offset_x + c_box * TILE_SIZE, self.offset_y + r_box * TILE_SIZE, TILE_SIZE, TILE_SIZE))
-
+        # Pick one atlas tile per occupied cell, later layers overriding earlier ones
+        tiles = {pos: "target" for pos in self.targets_rc}
+        for pos in self.walls_rc:
+            tiles[pos] = "wall"
+        for pos in self.boxes_rc:
+            tiles[pos] = "box_on_target" if tiles.get(pos) == "target" else "box"
         if self.player_pos_rc:
-            r_player, c_player = self.player_pos_rc
-            pygame.draw.rect(self.screen, PLAYER_COLOR, (
-            self.offset_x + c_player * TILE_SIZE, self.offset_y + r_player * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+            tiles[self.player_pos_rc] = "player_on_target" if tiles.get(self.player_pos_rc) == "target" else "player"
+        self.tile_atlas.draw_board(self.screen, TILE_SIZE, [(r, c, name) for (r, c), name in tiles.items()],
+                                   self.offset_x, self.offset_y)
+        if self.ghost_player:
+            ghost_cells = [(r, c, "box") for r, c in self.ghost_boxes if tiles.get((r, c), "target") == "target"]
+            ghost_cells.append((self.ghost_player[0], self.ghost_player[1], "player"))
+            self.tile_atlas.draw_board(self.screen, TILE_SIZE, ghost_cells, self.offset_x, self.offset_y, ghost=True)
+
+        if self.drag_box:
+            # Outline the picked-up box and the tile it would be dropped on
+            for r, c in (self.drag_box, self.cell_at(pygame.mouse.get_pos())):
+                pygame.draw.rect(self.screen, BUTTON_HOVER_COLOR, (self.offset_x + c * TILE_SIZE,
+                                                                   self.offset_y + r * TILE_SIZE, TILE_SIZE, TILE_SIZE), 3)
 
         # Draw level info (name, moves) at the top
         level_name_text = self.small_font.render(f"Level: {self.level_data['name']}", True, TEXT_COLOR)
         moves_text_surface = self.small_font.render(f"Moves: {self.moves}", True, TEXT_COLOR)
         self.screen.blit(level_name_text, (10, 10))
         self.screen.blit(moves_text_surface, (10, 35))
+        if self.ghost_label:
+            self.screen.blit(self.small_font.render(self.ghost_label, True, TEXT_COLOR), (10, 60))
 
-        reset_instr = self.small_font.render("R: Reset | ESC: Menu", True, TEXT_COLOR)
+        if self.hint and self.hint_timer > 0:
+            (r, c), (dr, dc) = self.hint
+            center = (self.offset_x + c * TILE_SIZE + TILE_SIZE // 2, self.offset_y + r * TILE_SIZE + TILE_SIZE // 2)
+            pygame.draw.rect(self.screen, MESSAGE_COLOR, (self.offset_x + c * TILE_SIZE, self.offset_y + r * TILE_SIZE,
+                                                          TILE_SIZE, TILE_SIZE), 3)
+            pygame.draw.line(self.screen, MESSAGE_COLOR, center,
+                             (center[0] + dc * TILE_SIZE, center[1] + dr * TILE_SIZE), 4)
+            self.hint_timer -= 1
+
+        reset_instr = self.small_font.render("R: Reset | U: Undo | H: Hint | ESC: Menu", True, TEXT_COLOR)
         self.screen.blit(reset_instr, (self.screen.get_width() - reset_instr.get_width() - 10, 10))
 
         if self.check_win():
             self.game_manager.set_ui_message(f"You Win! Moves: {self.moves}", 300)  # Show on game manager screen
             if self.game_manager.current_user:  # Only save if not guest
-                self.game_manager.add_score(self.level_id, self.moves)
+                self.game_manager.add_score(self.level_id, self.moves, encode_run(self.move_log))
+            self.end_attempt("solves")
+            self.game_manager.autosave_game(finished=True)
 
             # Transition to leaderboard view for this level
             self.game_manager.current_level_id_playing = self.level_id  # Ensure correct leaderboard
@@ -864,7 +3534,7 @@ class SokobanLevel:
         pr, pc = self.player_pos_rc
         next_r, next_c = pr + dr, pc + dc
 
-        if (next_r, next_c) in self.walls_rc:
+        if not self.is_open(next_r, next_c):  # Walls, and off the end of ragged or open rows
             return
 
         box_to_move_idx = -1
@@ -875,14 +3545,312 @@ class SokobanLevel:
 
         if box_to_move_idx != -1:  # Pushing a box
             box_next_r, box_next_c = next_r + dr, next_c + dc
-            if (box_next_r, box_next_c) in self.walls_rc or (box_next_r, box_next_c) in self.boxes_rc:
+            if not self.is_open(box_next_r, box_next_c) or (box_next_r, box_next_c) in self.boxes_rc:
                 return  # Box push blocked
             self.boxes_rc[box_to_move_idx] = (box_next_r, box_next_c)
 
         self.player_pos_rc = (next_r, next_c)
         self.moves += 1
+        self.move_log.append((DIRECTIONS.index((dr, dc)), box_to_move_idx != -1))
+        if self.ghost_next_ticks is None:
+            self.ghost_next_ticks = pygame.time.get_ticks()  # The race starts with the first move
+        if self.start_ticks is None:
+            self.start_ticks = pygame.time.get_ticks()
+            if self.telemetry:
+                self.telemetry.counts["plays"] += 1
+        if self.telemetry:
+            self.telemetry.visits[next_r * self.telemetry_cols + next_c] += 1
+        if box_to_move_idx != -1:
+            if self.telemetry:
+                self.telemetry.pushes[box_next_r * self.telemetry_cols + box_next_c] += 1
+            self.update_reachable_after_push((next_r, next_c), (box_next_r, box_next_c))
+            self.hint = None  # The highlighted push was for the previous position
         # self.draw() # Game manager calls draw in its loop
 
+    def undo(self):
+        # Steps back through move_log; a push is undone by pulling the box back onto the player's old cell
+        if not self.move_log:
+            return False
+        direction, pushed = self.move_log.pop()
+        dr, dc = DIRECTIONS[direction]
+        pr, pc = self.player_pos_rc
+        if pushed:
+            self.boxes_rc[self.boxes_rc.index((pr + dr, pc + dc))] = (pr, pc)
+            self.reachable = None
+            self.state_version += 1
+            self.hint = None
+        self.player_pos_rc = (pr - dr, pc - dc)
+        self.moves -= 1
+        if self.autosave_synced > len(self.move_log):
+            self.autosave_synced -= 1
+            self.autosave_undos += 1
+        return True
+
+    def replay(self, steps):
+        # Rebuilds a position straight from (direction, pushed) steps, e.g. a resumed autosave. Stops at the
+        # first step that doesn't fit the level.
+        box_index = {box: i for i, box in enumerate(self.boxes_rc)}
+        r, c = self.player_pos_rc
+        for direction, pushed in steps:
+            dr, dc = DIRECTIONS[direction]
+            next_cell = (r + dr, c + dc)
+            if not self.is_open(*next_cell) or (next_cell in box_index) != pushed:
+                break
+            if pushed:
+                box_to = (next_cell[0] + dr, next_cell[1] + dc)
+                if not self.is_open(*box_to) or box_to in box_index:
+                    break
+                i = box_index.pop(next_cell)
+                box_index[box_to] = i
+                self.boxes_rc[i] = box_to
+            r, c = next_cell
+            self.move_log.append((direction, pushed))
+        self.player_pos_rc = (r, c)
+        self.moves = len(self.move_log)
+        self.reachable = None
+        self.state_version += 1
+
+    def end_attempt(self, outcome):
+        # outcome: "solves", "restarts" or "abandons"; attempts without a single move aren't counted
+        if self.attempt_over or not self.telemetry or self.start_ticks is None:
+            return
+        self.attempt_over = True
+        self.telemetry.counts[outcome] += 1
+        if outcome == "solves":
+            self.telemetry.counts["solve_seconds"] += (pygame.time.get_ticks() - self.start_ticks) // 1000
+
+    def is_open(self, r, c):
+        # Inside the (possibly ragged) level rows and not a wall
+        return 0 <= r < len(self.level) and 0 <= c < len(self.level[r]) and (r, c) not in self.walls_set
+
+    def flood_fill(self, start, blocked, region=None):
+        # Grows region (a set, possibly already filled) with every open cell reachable from start
+        region = set() if region is None else region
+        region.add(start)
+        stack = [start]
+        while stack:
+            r, c = stack.pop()
+            for dr, dc in DIRECTIONS:
+                cell = (r + dr, c + dc)
+                if cell not in region and cell not in blocked and self.is_open(*cell):
+                    region.add(cell)
+                    stack.append(cell)
+        return region
+
+    def get_reachable(self):
+        if self.reachable is None:
+            self.reachable = self.flood_fill(self.player_pos_rc, set(self.boxes_rc))
+        return self.reachable
+
+    def update_reachable_after_push(self, freed_cell, blocked_cell):
+        self.state_version += 1
+        if self.reachable is None:
+            return
+        # The cell the box left joins the player's area, possibly opening up more of the level
+        was_reachable = blocked_cell in self.reachable
+        self.reachable.discard(blocked_cell)
+        self.flood_fill(freed_cell, set(self.boxes_rc), self.reachable)
+        if not was_reachable:
+            return
+
+        # The box's new cell may split the area in two. If its open neighbours are still joined through
+        # the ring of 8 cells around it, they stay connected; otherwise recompute on the next query.
+        r, c = blocked_cell
+        ring = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+        open_ring = [(r + dr, c + dc) in self.reachable for dr, dc in ring]
+        arcs_with_neighbour = 0
+        in_arc = False
+        arc_has_neighbour = False
+        start = open_ring.index(False) if False in open_ring else 0
+        for i in range(start + 1, start + 9):
+            idx = i % 8
+            if open_ring[idx]:
+                in_arc = True
+                arc_has_neighbour = arc_has_neighbour or idx % 2 == 1  # Odd ring positions are orthogonal
+            elif in_arc:
+                arcs_with_neighbour += arc_has_neighbour
+                in_arc = arc_has_neighbour = False
+        arcs_with_neighbour += in_arc and arc_has_neighbour
+        if arcs_with_neighbour > 1:
+            self.reachable = None
+
+    def cell_at(self, pos):
+        return (pos[1] - self.offset_y) // TILE_SIZE, (pos[0] - self.offset_x) // TILE_SIZE
+
+    def walk_path(self, target):
+        # Shortest walk (list of (d_row, d_col)) to target without pushing, or None if it can't be reached
+        reachable = self.get_reachable()
+        if target not in reachable:
+            return None
+        tree_key = (self.player_pos_rc, self.state_version)
+        if self.path_tree_key != tree_key:
+            # One BFS tree per position answers every click until the player moves again
+            self.path_tree = {self.player_pos_rc: None}
+            queue = deque([self.player_pos_rc])
+            while queue:
+                r, c = queue.popleft()
+                for dr, dc in DIRECTIONS:
+                    cell = (r + dr, c + dc)
+                    if cell in reachable and cell not in self.path_tree:
+                        self.path_tree[cell] = ((r, c), (dr, dc))
+                        queue.append(cell)
+            self.path_tree_key = tree_key
+        path = []
+        while self.path_tree[target] is not None:
+            target, step = self.path_tree[target]
+            path.append(step)
+        path.reverse()
+        return path
+
+    def bfs_path(self, start, goal, blocked):
+        # Walk between two cells with the given cells blocked; used while planning box pushes
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            cell = queue.popleft()
+            if cell == goal:
+                break
+            for dr, dc in DIRECTIONS:
+                nxt = (cell[0] + dr, cell[1] + dc)
+                if nxt not in parents and nxt not in blocked and self.is_open(*nxt):
+                    parents[nxt] = (cell, (dr, dc))
+                    queue.append(nxt)
+        if goal not in parents:
+            return None
+        path = []
+        while parents[goal] is not None:
+            goal, step = parents[goal]
+            path.append(step)
+        path.reverse()
+        return path
+
+    def box_push_path(self, box, goal):
+        # Fewest-pushes route for one box (other boxes stay put), expanded into single moves
+        other_boxes = set(self.boxes_rc) - {box}
+        start_state = (box, None)  # (box cell, direction of the push that got it there)
+        parents = {start_state: None}
+        queue = deque([start_state])
+        found = None
+        while queue:
+            state = queue.popleft()
+            box_cell, last_dir = state
+            if box_cell == goal:
+                found = state
+                break
+            if last_dir is None:
+                region = self.get_reachable()
+            else:
+                player = (box_cell[0] - last_dir[0], box_cell[1] - last_dir[1])
+                region = self.flood_fill(player, other_boxes | {box_cell})
+            for dr, dc in DIRECTIONS:
+                push_from = (box_cell[0] - dr, box_cell[1] - dc)
+                push_to = (box_cell[0] + dr, box_cell[1] + dc)
+                next_state = (push_to, (dr, dc))
+                if push_from in region and next_state not in parents and push_to not in other_boxes and \
+                        self.is_open(*push_to):
+                    parents[next_state] = state
+                    queue.append(next_state)
+        if found is None:
+            return None
+
+        pushes = []
+        while parents[found] is not None:
+            pushes.append(found[1])
+            found = parents[found]
+        pushes.reverse()
+
+        moves = []
+        player, box_cell = self.player_pos_rc, box
+        for dr, dc in pushes:
+            walk = self.bfs_path(player, (box_cell[0] - dr, box_cell[1] - dc), other_boxes | {box_cell})
+            moves.extend(walk)
+            moves.append((dr, dc))
+            player, box_cell = box_cell, (box_cell[0] + dr, box_cell[1] + dc)
+        return moves
+
+    def handle_mouse_down(self, pos, button):
+        if button != 1 or not self.valid_level:
+            return
+        cell = self.cell_at(pos)
+        self.cancel_auto_moves()
+        if cell in self.boxes_rc:
+            self.drag_box = cell  # Dropping it elsewhere runs a push search, see handle_mouse_up
+            return
+        path = self.walk_path(cell)
+        if path:
+            self.move_queue.extend(path)
+        elif path is None and self.is_open(*cell):
+            self.game_manager.set_ui_message("Can't walk there.", 60)
+
+    def handle_mouse_up(self, pos, button):
+        if button != 1 or self.drag_box is None:
+            return
+        box, self.drag_box = self.drag_box, None
+        cell = self.cell_at(pos)
+        if cell == box:
+            return
+        moves = self.box_push_path(box, cell)
+        if moves is None:
+            self.game_manager.set_ui_message("That box can't be pushed there.", 90)
+        else:
+            self.move_queue.extend(moves)
+
+    def cancel_auto_moves(self):
+        self.move_queue.clear()
+
+    def hint_state(self):
+        return self.player_pos_rc, tuple(sorted(self.boxes_rc))
+
+    def request_hint(self):
+        if not self.valid_level or self.check_win():
+            return
+        engine = self.game_manager.get_hint_engine(self)
+        state = self.hint_state()
+        request_id = self.game_manager.hint_worker.submit(engine, state[0], state[1])
+        self.hint_request = (request_id, state)
+        self.hint = None
+        self.game_manager.set_ui_message("Looking for a hint...", int(HINT_TIME_BUDGET * 60) + 60)
+
+    def cancel_hint(self):
+        # The level is being left or reset; its pending hint result would never be collected
+        if self.hint_request:
+            self.game_manager.hint_worker.cancel(self.hint_request[0])
+            self.hint_request = None
+
+    def poll_hint(self):
+        request_id, state = self.hint_request
+        result = self.game_manager.hint_worker.poll(request_id)
+        if result is None:
+            return
+        self.hint_request = None
+        if state != self.hint_state():
+            self.request_hint()  # The player moved while we were searching
+            return
+        names = {(-1, 0): "up", (1, 0): "down", (0, -1): "left", (0, 1): "right"}
+        if result[0] == "push":
+            self.hint = (result[1], result[2])
+            self.hint_timer = HINT_DISPLAY_FRAMES
+            self.game_manager.set_ui_message(f"Hint: push the highlighted box {names[result[2]]}.", 150)
+        elif result[0] == "unsolvable":
+            self.game_manager.set_ui_message("No solution from here. Press R to restart.", 240)
+        elif result[0] == "timeout":
+            self.game_manager.set_ui_message("No hint found yet. Press H to keep searching.", 180)
+
+    def update(self):
+        if self.hint_request:
+            self.poll_hint()
+        if self.ghost_steps:
+            self.advance_ghost()
+
+        # Queued moves go through move_player one step at a time, so move counting stays exact
+        now = pygame.time.get_ticks()
+        if self.move_queue and now - self.last_auto_move_ticks >= AUTO_MOVE_STEP_MS:
+            self.last_auto_move_ticks = now
+            dr, dc = self.move_queue.popleft()
+            self.move_player(dr, dc)
+            if self.check_win():
+                self.cancel_auto_moves()
+
     def check_win(self):
         if not self.targets_rc: return False  # No targets means no win condition (or auto-win if also no boxes needed)
         if len(self.boxes_rc) < len(self.targets_rc): return False  # Not enough boxes for targets
@@ -893,7 +3861,523 @@ class SokobanLevel:
         return True
 
 
-# Run the game
+# Just enough of SokobanGame for SokobanLevel to run without a window, saved scores or telemetry
+class HeadlessGame:
+    def __init__(self, levels):
+        self.levels = levels
+        self.scores = {}
+        self.diagnostics = None
+        self.current_state = "game"
+        self.screen = pygame.Surface((800, 600))
+        self.font = self.small_font = None
+        self.tile_atlas = None
+
+    def get_level(self, level_id):
+        return self.levels.get(level_id)
+
+    def level_telemetry(self, level_id, rows, cols):
+        return None
+
+    def set_ui_message(self, msg, duration=180):
+        pass
+
+    def setup_menu_ui(self):
+        pass
+
+
+def random_fuzz_level(rng, source_levels):
+    # Either a mutated copy of a real level or random ragged rows; always exactly one player
+    if source_levels and rng.random() < 0.5:
+        grid = [list(row) for row in rng.choice(source_levels)]
+        for _ in range(rng.randint(1, 6)):
+            r = rng.randrange(len(grid))
+            mutation = rng.randrange(3)
+            if mutation == 0 and grid[r]:
+                grid[r][rng.randrange(len(grid[r]))] = rng.choice("#  bt*")
+            elif mutation == 1:
+                del grid[r][rng.randint(0, len(grid[r])):]  # Ragged row, like level "ali"
+            else:
+                grid.insert(r, list(rng.choice(["", "#", "   t", " b ", "#####"])))
+    else:
+        grid = [[rng.choice("       ####bbtt*") for _ in range(rng.randint(1, 12))] for _ in range(rng.randint(1, 9))]
+        if rng.random() < 0.7:  # Usually walled in, as levels made in the editor are
+            grid = [['#'] * (len(grid[0]) + 2)] + [['#'] + row + ['#'] for row in grid] + [['#'] * (len(grid[-1]) + 2)]
+    for row in grid:
+        for c, char in enumerate(row):
+            if char in "p+":
+                row[c] = ' ' if char == 'p' else 't'
+    cells = [(r, c) for r, row in enumerate(grid) for c, char in enumerate(row) if char in " t"]
+    if not cells:
+        return random_fuzz_level(rng, source_levels)
+    r, c = rng.choice(cells)
+    grid[r][c] = 'p' if grid[r][c] == ' ' else '+'
+    return ["".join(row) for row in grid]
+
+
+def check_fuzz_invariants(level, rows, box_count):
+    # Returns a (name, detail) pair for the first broken invariant, or None
+    boxes = level.boxes_rc
+    if len(boxes) != box_count or len(set(boxes)) != box_count:
+        return "box count conserved", f"{box_count} boxes became {len(set(boxes))} distinct of {len(boxes)}"
+    for kind, (r, c) in [("player", level.player_pos_rc)] + [("box", box) for box in boxes]:
+        if not (0 <= r < len(rows) and 0 <= c < len(rows[r])):
+            return "inside the level", f"{kind} at {(r, c)}"
+        if rows[r][c] == '#':
+            return "nothing on a wall", f"{kind} at {(r, c)}"
+    targets = [(r, c) for r, row in enumerate(rows) for c, char in enumerate(row) if char in "t+*"]
+    reference_win = bool(targets) and set(targets) <= set(boxes)
+    if level.check_win() != reference_win:
+        return "check_win matches reference", f"check_win() is {not reference_win}"
+    return None
+
+
+def run_fuzz_case(rows, moves):
+    # Plays moves (direction indexes) on rows; returns ((name, step, detail) or None, steps played)
+    level = SokobanLevel(HeadlessGame({"fuzz": {"name": "fuzz", "data": rows}}), "fuzz")
+    box_count = len(level.boxes_rc)
+    problem = check_fuzz_invariants(level, rows, box_count)
+    if problem:
+        return (problem[0], -1, problem[1]), 0
+    for step, direction in enumerate(moves):
+        before = (level.player_pos_rc, list(level.boxes_rc), level.moves)
+        level.move_player(*DIRECTIONS[direction])
+        problem = check_fuzz_invariants(level, rows, box_count)
+        if problem:
+            return (problem[0], step, problem[1]), step + 1
+        after = (level.player_pos_rc, list(level.boxes_rc), level.moves)
+        if after != before:
+            level.undo()
+            if (level.player_pos_rc, level.boxes_rc, level.moves) != before:
+                return ("undo restores state", step, f"{before} became {level.player_pos_rc, level.boxes_rc}"), step + 1
+            level.move_player(*DIRECTIONS[direction])
+            if (level.player_pos_rc, level.boxes_rc, level.moves) != after:
+                return ("redo after undo", step, f"{after} became {level.player_pos_rc, level.boxes_rc}"), step + 1
+        if step % FUZZ_REACHABLE_CHECK_EVERY == 0 and level.reachable is not None:
+            fresh = level.flood_fill(level.player_pos_rc, set(level.boxes_rc))
+            if level.reachable != fresh:
+                return ("reachable cache matches flood fill", step, f"{len(level.reachable)} vs {len(fresh)} cells"), \
+                    step + 1
+        level.get_reachable()
+    return None, len(moves)
+
+
+def shrink_fuzz_case(rows, moves, name):
+    # Greedily drops moves, rows, row ends and level contents while the same invariant still breaks
+    def failure(candidate_rows, candidate_moves):
+        if sum(char in "p+" for row in candidate_rows for char in row) != 1:
+            return None
+        result, _ = run_fuzz_case(candidate_rows, candidate_moves)
+        return result if result and result[0] == name else None
+
+    result = failure(rows, moves)
+    moves = moves[:result[1] + 1]
+    chunk = max(1, len(moves) // 2)
+    while chunk:
+        i = 0
+        while i < len(moves):
+            candidate = moves[:i] + moves[i + chunk:]
+            if failure(rows, candidate):
+                moves = candidate
+            else:
+                i += chunk
+        chunk //= 2
+
+    shrunk = True
+    while shrunk:
+        shrunk = False
+        candidates = [rows[:r] + rows[r + 1:] for r in range(len(rows))]
+        candidates += [rows[:r] + [row[:-1]] + rows[r + 1:] for r, row in enumerate(rows) if row]
+        candidates += [rows[:r] + [row[:c] + ' ' + row[c + 1:]] + rows[r + 1:]
+                       for r, row in enumerate(rows) for c, char in enumerate(row) if char in "#bt*"]
+        for candidate in candidates:
+            result = failure(candidate, moves)
+            if result:
+                rows, moves = candidate, moves[:result[1] + 1]
+                shrunk = True
+                break
+    return rows, moves, failure(rows, moves)
+
+
+def fuzz_worker(job):
+    # Runs random cases until the deadline; returns (steps, cases, {invariant: shrunk case})
+    seed, seconds, source_levels = job
+    rng = random.Random(seed)
+    steps = cases = 0
+    failures = {}
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        rows = random_fuzz_level(rng, source_levels)
+        moves = [rng.randrange(4) for _ in range(FUZZ_MOVES_PER_CASE)]
+        result, played = run_fuzz_case(rows, moves)
+        steps += played
+        cases += 1
+        if result and result[0] not in failures:
+            failures[result[0]] = shrink_fuzz_case(rows, moves, result[0])
+    return steps, cases, failures
+
+
+def run_fuzzer(seconds, processes=None, seed=None):
+    # Returns {invariant: (rows, moves, (name, step, detail))} for every invariant found broken
+    source_levels = [["#####", "#pbt#", "#####"]]
+    if os.path.exists(LEVELS_FILE):
+        with open(LEVELS_FILE, 'r') as f:
+            source_levels += [level_data["data"] for level_data in json.load(f).values()]
+    processes = processes or os.cpu_count() or 1
+    seed = random.randrange(1 << 30) if seed is None else seed
+    jobs = [(seed + i, seconds, source_levels) for i in range(processes)]
+    if processes == 1:
+        results = list(map(fuzz_worker, jobs))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(fuzz_worker, jobs)
+    steps = sum(result[0] for result in results)
+    cases = sum(result[1] for result in results)
+    failures = {}
+    for _, _, worker_failures in results:
+        for name, case in worker_failures.items():
+            if name not in failures or len(case[1]) < len(failures[name][1]):
+                failures[name] = case
+    print(f"Seed {seed}: {steps} steps in {cases} levels on {processes} processes "
+          f"({steps * 60 // max(seconds, 1)} steps/minute)")
+    return failures
+
+
+def parse_load_test_mix(text):
+    # "score=50,login=5" -> [("score", 50), ("login", 5)]
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in LOAD_TEST_OPERATIONS or not weight.strip().isdigit():
+            raise ValueError(f"Bad mix entry '{part}' (operations: {', '.join(LOAD_TEST_OPERATIONS)})")
+        if int(weight):
+            mix.append((name, int(weight)))
+    if not mix:
+        raise ValueError("The mix needs at least one operation with a weight above 0")
+    return mix
+
+
+def load_test_level(number):
+    # A small valid level whose layout is different for every number: its bits are wall notches along the bottom
+    bits = bin(number)[2:]
+    width = len(bits) + 6
+    notches = "".join('#' if bit == "1" else ' ' for bit in bits)
+    return ["#" * width, "#pbt" + " " * (width - 5) + "#", "#" + " " * (width - 2) + "#",
+            "#    " + notches + "#", "#" * width]
+
+
+def seed_load_test_data(users, levels, scores, rng):
+    # Writes users.json, levels.json and scores.json in the current directory at the requested scale
+    password_hash = hash_password(LOAD_TEST_PASSWORD)  # One hash for everybody, hashing millions would take days
+    user_names = [f"seed{i}" for i in range(users)]
+    write_json_atomic(USERS_FILE, dict({name: {"password_hash": password_hash, "role": PLAYER} for name in user_names},
+                                       admin={"password_hash": password_hash, "role": ADMIN}))
+    today = datetime.now().strftime("%Y-%m-%d")
+    write_json_atomic(LEVELS_FILE, {str(i): {"name": f"Seed {i}", "data": load_test_level(i), "created_by": "admin",
+                                             "date": today} for i in range(levels)})
+    seeded_scores = {}
+    per_level = min(scores // levels, users) if levels else 0
+    start = datetime.now() - timedelta(days=60)
+    for level_number in range(levels):
+        entries = [{"username": user_names[(level_number + i) % users], "moves": rng.randint(10, 500),
+                    "date": (start + timedelta(minutes=rng.randrange(86400))).strftime("%Y-%m-%d %H:%M")}
+                   for i in range(per_level + (level_number < min(scores - per_level * levels, levels)))]
+        seeded_scores[str(level_number)] = sorted(entries, key=score_sort_key)
+    write_json_atomic(SCORES_FILE, seeded_scores)
+    return user_names
+
+
+def load_test_worker(worker_id, mix, seconds, seed, seed_users, barrier, results):
+    # One kiosk: a headless SokobanGame doing random operations on the shared data files until the time is up
+    rng = random.Random(seed * 1000 + worker_id)
+    game = SokobanGame(headless=True)
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    latencies = {name: [] for name in names + ["sync"]}
+    errors = dict.fromkeys(latencies, 0)
+    known_users = list(seed_users)
+    level_ids = [level_id for level_id in game.levels if level_id.isdigit()]
+    done = {"registered": [], "logged_in": [], "levels": [], "best": {}}  # What the data files must still show after
+    counter = 0
+
+    try:
+        barrier.wait()  # Every kiosk is loaded before the clock starts
+    except threading.BrokenBarrierError:
+        pass  # Another kiosk died while loading; the rest still run
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        counter += 1
+        if pygame.time.get_ticks() >= game.next_data_poll_ticks:  # Same once-a-second check a kiosk makes per frame
+            start = time.perf_counter()
+            game.poll_data_files()
+            game.score_sync.wait()  # The re-read a kiosk's sync thread does while frames carry on
+            while not game.score_sync.levels_read.empty():
+                game.merge_read_scores()
+            latencies["sync"].append(time.perf_counter() - start)
+        operation = rng.choices(names, weights)[0]
+        if operation == "login" and not known_users:
+            operation = "register"
+        start = time.perf_counter()
+        ok = True
+        if operation == "register":
+            username = f"kiosk{worker_id}_{counter}"
+            ok, _ = game.register_user(username, LOAD_TEST_PASSWORD)
+            if ok:
+                known_users.append(username)
+                done["registered"].append(username)
+        elif operation == "login":
+            username = rng.choice(known_users)
+            ok, _ = game.login_user(username, LOAD_TEST_PASSWORD)
+            if ok:
+                done["logged_in"].append(username)
+        elif operation == "score":
+            game.current_user = rng.choice(known_users) if known_users else "admin"
+            level_id = rng.choice(level_ids) if level_ids else "0"
+            moves = rng.randint(1, 500)
+            game.add_score(level_id, moves)
+            game.score_sync.wait()  # Timed until the score is on disk, not just queued
+            best_key = f"{level_id}|{game.current_user}"
+            done["best"][best_key] = min(moves, done["best"].get(best_key, moves))
+        elif operation == "save_level":
+            number = (worker_id + 1) * 10 ** 9 + counter  # Unique per kiosk, so saves are never refused as duplicates
+            ok, _ = game.save_level(f"Load {number}", load_test_level(number))
+            if ok:
+                done["levels"].append(f"Load {number}")
+        else:
+            level_id = rng.choice(level_ids) if level_ids else "0"
+            total, _ = game.query_scores(level_id, 0, LEADERBOARD_PAGE_SIZE)
+            if total > LEADERBOARD_PAGE_SIZE:  # Scroll somewhere, like the leaderboard view does
+                game.query_scores(level_id, rng.randrange(total), LEADERBOARD_PAGE_SIZE)
+            if known_users:
+                game.score_rank(level_id, rng.choice(known_users))
+        latencies[operation].append(time.perf_counter() - start)
+        if not ok:
+            errors[operation] += 1
+    game.score_sync.wait()
+    results.put((worker_id, latencies, errors, done))
+
+
+def check_load_test_data(worker_results):
+    # Returns a list of problems: unreadable files, leftover lock/temp files and updates that got lost
+    problems = []
+    contents = {}
+    for path in [USERS_FILE, LEVELS_FILE, SCORES_FILE, SESSION_FILE]:
+        try:
+            with open(path, 'r') as f:
+                contents[path] = json.load(f)
+        except FileNotFoundError:
+            contents[path] = {}
+        except (ValueError, UnicodeDecodeError) as e:
+            problems.append(f"{path} is corrupt: {e}")
+            contents[path] = {}
+    leftovers = [name for name in os.listdir(".") if name.endswith(".lock") or name.endswith(".tmp")]
+    if leftovers:
+        problems.append(f"Left behind: {', '.join(sorted(leftovers))}")
+
+    users, levels, scores = contents[USERS_FILE], contents[LEVELS_FILE], contents[SCORES_FILE]
+    level_names = {level_data["name"] for level_data in levels.values()}
+    best = {}
+    for level_id, entries in scores.items():
+        if [entry["username"] for entry in entries] != list({entry["username"]: None for entry in entries}):
+            problems.append(f"Level {level_id} has more than one score for a user")
+        if entries != sorted(entries, key=score_sort_key):
+            problems.append(f"Level {level_id} scores are out of order")
+        for entry in entries:
+            best[f"{level_id}|{entry['username']}"] = entry["moves"]
+
+    lost = {"registrations": 0, "levels": 0, "scores": 0, "sessions": 0}
+    players_logged_in = set()
+    for _, _, _, done in worker_results:
+        lost["registrations"] += sum(username not in users for username in done["registered"])
+        lost["levels"] += sum(name not in level_names for name in done["levels"])
+        lost["scores"] += sum(best.get(key, moves + 1) > moves for key, moves in done["best"].items())
+        players_logged_in.update(username for username in done["logged_in"] if users[username]["role"] != ADMIN)
+    session = contents[SESSION_FILE].get(socket.gethostname(), {})
+    if players_logged_in and session.get("username") not in players_logged_in:
+        lost["sessions"] += 1  # Every kiosk here shares one session: whoever logged in last
+    for kind, count in lost.items():
+        if count:
+            problems.append(f"Lost {count} {kind}")
+    return problems
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_load_test(workers, mix, seconds, use_threads, seed, seed_users):
+    # Runs the kiosks in the current directory; returns ({operation: (count, sorted latencies, errors)}, problems)
+    if use_threads:
+        barrier, results = threading.Barrier(workers), queue.Queue()
+        kiosks = [threading.Thread(target=load_test_worker, daemon=True,
+                                   args=(i, mix, seconds, seed, seed_users, barrier, results)) for i in range(workers)]
+    else:
+        barrier, results = multiprocessing.Barrier(workers), multiprocessing.Queue()
+        kiosks = [multiprocessing.Process(target=load_test_worker,
+                                          args=(i, mix, seconds, seed, seed_users, barrier, results))
+                  for i in range(workers)]
+    for kiosk in kiosks:
+        kiosk.start()
+    worker_results = []  # Drained before joining, big results would block the pipe
+    while len(worker_results) < workers:
+        try:
+            worker_results.append(results.get(timeout=1))
+        except queue.Empty:
+            if not any(kiosk.is_alive() for kiosk in kiosks):
+                break  # Some kiosk died without reporting (e.g. killed for running out of memory)
+            if any(not kiosk.is_alive() for kiosk in kiosks):
+                barrier.abort()  # Don't keep the others waiting for a kiosk that died while loading
+    for kiosk in kiosks:
+        kiosk.join()
+
+    report = {}
+    for operation in LOAD_TEST_OPERATIONS + ["sync"]:
+        latencies = sorted(value for _, worker_latencies, _, _ in worker_results
+                           for value in worker_latencies.get(operation, []))
+        if latencies:
+            report[operation] = (latencies, sum(errors.get(operation, 0) for _, _, errors, _ in worker_results))
+    problems = check_load_test_data(worker_results)
+    reported = {worker_id for worker_id, _, _, _ in worker_results}
+    for worker_id, kiosk in enumerate(kiosks):
+        if worker_id not in reported:
+            exit_code = getattr(kiosk, "exitcode", None)
+            problems.append(f"Kiosk {worker_id} died" + (f" (exit code {exit_code})" if exit_code is not None else ""))
+    return report, problems
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Multi-User Sokoban")
+    commands = parser.add_subparsers(dest="command")
+    play_parser = commands.add_parser("play", help="Start the game (default)")
+    play_parser.add_argument("--diagnostics", action="store_true",
+                             help="Trace memory use by subsystem and report growth between screens (F3 shows it)")
+    import_parser = commands.add_parser("import-xsb", help="Convert XSB/.sok collections into a level pack")
+    import_parser.add_argument("sources", nargs="+", help="XSB/.sok files, read as a stream")
+    import_parser.add_argument("--out", default=LEVEL_PACK_FILE, help="Level pack to write")
+    duplicates_parser = commands.add_parser("find-duplicates", help="Group levels that are the same up to symmetry")
+    duplicates_parser.add_argument("--pack", default=LEVEL_PACK_FILE, help="Level pack to include, if it exists")
+    export_parser = commands.add_parser("export-scores", help="Write scores as a sorted run for import-scores")
+    export_parser.add_argument("out", help="Export file (JSON lines)")
+    export_parser.add_argument("--scores", default=SCORES_FILE, help="Scores file to export")
+    import_scores_parser = commands.add_parser("import-scores", help="Merge score exports from other kiosks")
+    import_scores_parser.add_argument("exports", nargs="+", help="Files written by export-scores")
+    import_scores_parser.add_argument("--scores", default=SCORES_FILE, help="Scores file to merge into")
+    import_scores_parser.add_argument("--out", help="Write the merged export here instead of into the scores file")
+    fuzz_parser = commands.add_parser("fuzz", help="Check the game rules on random levels and moves")
+    fuzz_parser.add_argument("--seconds", type=int, default=60, help="How long to run")
+    fuzz_parser.add_argument("--processes", type=int, default=None, help="Worker processes (default: all cores)")
+    fuzz_parser.add_argument("--seed", type=int, default=None, help="Repeat an earlier run")
+    load_parser = commands.add_parser("load-test", help="Run many headless kiosks against one shared data directory")
+    load_parser.add_argument("--kiosks", default="1,2,4,8",
+                             help="Comma-separated kiosk counts; each gets its own run on a fresh copy of the data")
+    load_parser.add_argument("--threads", action="store_true", help="Run kiosks as threads instead of processes")
+    load_parser.add_argument("--seconds", type=int, default=20, help="How long each run lasts")
+    load_parser.add_argument("--mix", default=LOAD_TEST_MIX, help="Operation weights, e.g. score=50,login=5")
+    load_parser.add_argument("--users", type=int, default=1000, help="Users in the data before the run")
+    load_parser.add_argument("--levels", type=int, default=100, help="Levels in the data before the run")
+    load_parser.add_argument("--scores", type=int, default=10000, help="Scores in the data before the run")
+    load_parser.add_argument("--dir", help="Where to put the data (default: a new temporary directory)")
+    load_parser.add_argument("--seed", type=int, default=None, help="Repeat an earlier run")
+    args = parser.parse_args(argv)
+
+    if args.command == "load-test":
+        mix = parse_load_test_mix(args.mix)
+        kiosk_counts = [int(count) for count in args.kiosks.split(",")]
+        seed = random.randrange(1 << 30) if args.seed is None else args.seed
+        base_dir = os.path.abspath(args.dir or tempfile.mkdtemp(prefix="sokoban-load-"))
+        seed_dir = os.path.join(base_dir, "seed")
+        os.makedirs(seed_dir, exist_ok=True)
+        start_dir = os.getcwd()
+        started = time.perf_counter()
+        os.chdir(seed_dir)
+        seed_users = seed_load_test_data(args.users, args.levels, args.scores, random.Random(seed))
+        os.chdir(start_dir)
+        print(f"Seed {seed}: {args.users} users, {args.levels} levels, {args.scores} scores in {seed_dir} "
+              f"({time.perf_counter() - started:.1f}s)")
+
+        summary = []
+        for kiosks in kiosk_counts:
+            run_dir = os.path.join(base_dir, f"kiosks-{kiosks}")
+            shutil.rmtree(run_dir, ignore_errors=True)
+            shutil.copytree(seed_dir, run_dir)
+            os.chdir(run_dir)
+            try:
+                report, problems = run_load_test(kiosks, mix, args.seconds, args.threads, seed, seed_users)
+            finally:
+                os.chdir(start_dir)
+            print(f"\n{kiosks} kiosks ({'threads' if args.threads else 'processes'}), {args.seconds}s:")
+            print(f"  {'operation':<12}{'count':>8}{'ops/s':>9}" +
+                  "".join(f"{name + ' ms':>10}" for name, _ in LOAD_TEST_PERCENTILES) + f"{'failed':>8}")
+            for operation, (latencies, errors) in report.items():
+                print(f"  {operation:<12}{len(latencies):>8}{len(latencies) / args.seconds:>9.1f}" +
+                      "".join(f"{percentile(latencies, fraction) * 1000:>10.1f}"
+                              for _, fraction in LOAD_TEST_PERCENTILES) + f"{errors:>8}")
+            for problem in problems:
+                print(f"  PROBLEM: {problem}")
+            if not problems:
+                print("  Data intact")
+            total = sum(len(latencies) for operation, (latencies, _) in report.items() if operation != "sync")
+            writes = sorted(value for operation in ["score", "save_level", "register"] if operation in report
+                            for value in report[operation][0])
+            summary.append((kiosks, total / args.seconds, percentile(writes, 0.99) * 1000 if writes else 0, problems))
+
+        print(f"\n  {'kiosks':<8}{'ops/s':>9}{'write p99 ms':>14}  data")
+        for kiosks, throughput, write_p99, problems in summary:
+            print(f"  {kiosks:<8}{throughput:>9.1f}{write_p99:>14.1f}  {'; '.join(problems) or 'intact'}")
+        if any(problems for *_, problems in summary):
+            sys.exit(1)
+        return
+
+    if args.command == "find-duplicates":
+        def level_items():
+            with open(LEVELS_FILE, 'r') as f:
+                for level_id, level_data in json.load(f).items():
+                    yield level_id, level_data["data"]
+            if os.path.exists(args.pack):
+                pack = LevelPack(args.pack)
+                for number in range(len(pack)):
+                    yield f"{LEVEL_PACK_ID_PREFIX}{number}", pack.get_level(number)["data"]
+                pack.close()
+
+        groups = group_duplicate_levels(level_items())
+        for ids in groups:
+            print(" ".join(ids))
+        print(f"{len(groups)} groups of duplicate levels")
+        return
+
+    if args.command == "export-scores":
+        print(f"Exported {export_scores_file(args.scores, args.out)} scores to {args.out}")
+        return
+
+    if args.command == "import-scores":
+        if args.out:  # Merge exports into one bigger export without touching any scores file
+            count = write_score_run(merge_score_runs([iter_score_run(path) for path in args.exports]), args.out)
+            print(f"Merged {count} scores into {args.out}")
+        else:
+            levels, entries = import_scores(args.exports, args.scores)
+            print(f"{args.scores} now has {entries} scores on {levels} levels")
+        return
+
+    if args.command == "fuzz":
+        failures = run_fuzzer(args.seconds, args.processes, args.seed)
+        for name, (rows, moves, (_, step, detail)) in sorted(failures.items()):
+            print(f"FAILED {name}: {detail}")
+            print(f"  level: {json.dumps(rows)}")
+            print(f"  moves: {''.join(FUZZ_MOVE_LETTERS[move] for move in moves)}")
+        if failures:
+            sys.exit(1)
+        print("All invariants held")
+        return
+
+    if args.command == "import-xsb":
+        count = LevelPack.write(args.out, (level for source in args.sources for level in iter_xsb_levels(source)))
+        print(f"Wrote {count} levels to {args.out}")
+        return
+
+    # Run the game
+    game = SokobanGame(diagnostics=getattr(args, "diagnostics", False))
+    game.run()
+
+
 if __name__ == "__main__":
-    game = SokobanGame()
-    game.run()
\ No newline at end of file
+    main(sys.argv[1:])
\ No newline at end of file